@@ -1,53 +1,85 @@
+import argparse
+import os
 import pygame
-import random
 import time
-import gpiozero
-import RPi.GPIO as GPIO
-import LCD1602
-
-btn = gpiozero.DigitalInputDevice(pin=25, pull_up=False)
-
-GPIO.setmode(GPIO.BCM)
-PIR_PIN = 17
-GPIO.setup(PIR_PIN, GPIO.IN)
-previous_pir_state = 0
+from collections import OrderedDict
+import engine
+from engine import COLS, ROWS, GRAY, WHITE, Game, PieceGenerator
+from hardware import BACKENDS, LcdWriter, create_backend
+from replay import ReplayPlayer, ReplayWriter, apply_input, load as load_replay
+from scores import ScoreStore
+from versus import DEFAULT_PORT, Link, Versus
+from profiler import NullProfiler, Profiler
+from telemetry import FrameLog, percentile
 
 
 # ゲーム画面設定
 BLOCK_SIZE = 30
-GRID_WIDTH, GRID_HEIGHT = 300, 600
+GRID_WIDTH, GRID_HEIGHT = COLS * BLOCK_SIZE, ROWS * BLOCK_SIZE
 PANEL_WIDTH = 200
 WIDTH, HEIGHT = GRID_WIDTH + PANEL_WIDTH, GRID_HEIGHT
+PANEL_RECT = (GRID_WIDTH + 1, 0, PANEL_WIDTH - 1, GRID_HEIGHT)  # 右端のグリッド線を除いたサイド画面領域
+PAUSE_BUTTON_RECT = pygame.Rect(GRID_WIDTH + 30, 250, 150, 40)
+
+
+# フレームレート設定
+TARGET_FPS = 60          # プレイ中の描画フレームレート上限
+IDLE_FPS = 15            # スタート/ポーズ/ゲームオーバー画面のフレームレート
+ADAPTIVE_FPS = True      # Trueなら待機画面でIDLE_FPSまで落とす
+VSYNC = False            # Trueなら垂直同期を要求(対応環境のみ)
+LOGIC_STEP = 10          # ゲームロジックの固定更新間隔(ms)
+MAX_LOGIC_LAG = 250      # 処理落ち時に追いつかせる最大時間(ms)
+GHOST_PIECE = True       # 着地位置のプレビューを表示
+REPLAY_GAMEOVER_WAIT = 2000  # リプレイ再生時・自動プレイ時にゲームオーバー画面を表示する時間(ms)
+ATTRACT_DELAY = 20000    # タイトル画面で操作がないときにデモを始めるまでの時間(ms、0ならデモなし)
+AI_ACTION_INTERVAL = 80  # デモでコンピュータが操作する間隔(ms)
+
+
+# パフォーマンス表示設定(F3キーで切り替え)
+PERF_OVERLAY_RECT = pygame.Rect(GRID_WIDTH + 1, 552, PANEL_WIDTH - 1, 48)  # サイド画面のスコアの下
+PERF_OVERLAY_INTERVAL = 250  # 表示内容の更新間隔(ms)
+PERF_OVERLAY_KEY = pygame.K_F3
+
+
+# 対戦モードの相手の盤面(ゲーム画面の右に並べる)
+RIVAL_PANEL_WIDTH = 170
+RIVAL_BLOCK_SIZE = 15
+RIVAL_RECT = pygame.Rect(WIDTH, 0, RIVAL_PANEL_WIDTH, HEIGHT)
+
+
+# ハイスコア表示設定
+TITLE_SCORE_ROWS = 5     # タイトル画面に表示する件数
+GAMEOVER_SCORE_ROWS = 3  # ゲームオーバー画面に表示する件数
 
-COLS = GRID_WIDTH // BLOCK_SIZE
-ROWS = GRID_HEIGHT // BLOCK_SIZE
+
+# テキスト描画キャッシュ設定
+FONT_NAME = "meiryo"
+TEXT_CACHE_SIZE = 128    # 描画済み文字列サーフェスの最大保持数
 
 
 # 色の定義
 BLACK = (0, 0, 0)
-GRAY = (100, 100, 100)
-WHITE = (255, 255, 255)
-
-
-# テトリミノの定義
-MINOS = [
-    ([[1, 1, 1, 1]], (0, 255, 255)),         # I
-    ([[1, 0, 0], [1, 1, 1]], (0, 0, 255)),   # J
-    ([[0, 0, 1], [1, 1, 1]], (255, 165, 0)), # L
-    ([[1, 1], [1, 1]], (255, 255, 0)),       # O
-    ([[0, 1, 1], [1, 1, 0]], (0, 255, 0)),   # S
-    ([[0, 1, 0], [1, 1, 1]], (128, 0, 128)), # T
-    ([[1, 1, 0], [0, 1, 1]], (255, 0, 0)),   # Z
-]
-
-class Tetrimino:
-    def __init__(self):
-        self.shape, self.color = random.choice(MINOS)
-        self.x = COLS // 2 - len(self.shape[0]) // 2
-        self.y = 0
 
-    def rotate(self):
-        self.shape = [list(row) for row in zip(*self.shape[::-1])]
+
+# ランダムイベントの表示色
+EVENT_COLORS = {
+    "+ BLOCKS": (255, 0, 0),
+    "CLEAN UP": (0, 255, 255),
+    "REVERSE": (128, 0, 128),
+    "COMMAND CONFUSION": (0, 255, 0),
+    "SPEED UP": (255, 165, 0),
+    "RESET": (255, 255, 255),
+}
+
+
+# キーと操作の対応(左、右、下、上、スペース)
+KEY_ACTIONS = {
+    pygame.K_LEFT: "left",
+    pygame.K_RIGHT: "right",
+    pygame.K_DOWN: "down",
+    pygame.K_UP: "rotate",
+    pygame.K_SPACE: "drop",
+}
 
 
 # スコアエフェクト
@@ -59,13 +91,16 @@ class ScoreEffect:
         self.color = color
         self.start_time = pygame.time.get_ticks()
         self.duration = duration
+        self.label = None
 
     def draw(self, screen):
         elapsed = pygame.time.get_ticks() - self.start_time
         if elapsed < self.duration:
             alpha = max(255 - (elapsed / self.duration) * 255, 0)
-            font = pygame.font.SysFont("meiryo", 40, bold=True)
-            label = font.render(self.text, True, self.color)
+            if self.label is None:
+                # フェード用にアルファを書き換えるのでキャッシュとは別の専用サーフェスを持つ
+                self.label = get_font(FONT_NAME, 40, True).render(self.text, True, self.color)
+            label = self.label
             label.set_alpha(alpha)
             rect = label.get_rect(center=(WIDTH // 2, self.y - (elapsed / self.duration) * 20))
             screen.blit(label, rect)
@@ -73,148 +108,46 @@ class ScoreEffect:
         return False
     
 
-# ランダムイベント発生処理(関数化)
-def trigger_random_event(grid, score_effects, abnormal_states, NORMAL_FALL_SPEED):
-    abnormal_active = any([
-        abnormal_states["reverse"],
-        abnormal_states["command_confusion"],
-        abnormal_states["speed_up"]
-    ])
-    available_abnormal_events = []
-    if not abnormal_states["reverse"]:
-        available_abnormal_events.append(3)
-    if not abnormal_states["command_confusion"]:
-        available_abnormal_events.append(4)
-    if not abnormal_states["speed_up"]:
-        available_abnormal_events.append(5)
-    possible_events = [1, 2]
-    if abnormal_active:
-        possible_events.append(6)
-    possible_events.extend(available_abnormal_events)
-    event_num = random.choice(possible_events)
-
-    if event_num == 1:
-        for _ in range(3):
-            hole_pos = random.randint(0, COLS - 1)
-            new_row = [GRAY if i != hole_pos else 0 for i in range(COLS)]
-            grid.pop(0)
-            grid.append(new_row)
-        score_effects.append(ScoreEffect(WIDTH // 2, HEIGHT // 2, "+ BLOCKS", (255, 0, 0)))
-
-    elif event_num == 2:
-        grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
-        score_effects.append(ScoreEffect(WIDTH // 2, HEIGHT // 2, "CLEAN UP", (0, 255, 255)))
-
-    elif event_num == 3:
-        abnormal_states["reverse"] = True
-        score_effects.append(ScoreEffect(WIDTH // 2, HEIGHT // 2, "REVERSE", (128, 0, 128)))
-
-    elif event_num == 4:
-        abnormal_states["command_confusion"] = True
-        keys = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_DOWN, pygame.K_UP, pygame.K_SPACE]
-        shuffled = keys[:]
-        while True:
-            random.shuffle(shuffled)
-            if any(k != s for k, s in zip(keys, shuffled)):
-                break
-        abnormal_states["shuffled_commands"] = dict(zip(keys, shuffled))
-        score_effects.append(ScoreEffect(WIDTH // 2, HEIGHT // 2, "COMMAND CONFUSION", (0, 255, 0)))
-
-    elif event_num == 5:
-        abnormal_states["speed_up"] = True
-        score_effects.append(ScoreEffect(WIDTH // 2, HEIGHT // 2, "SPEED UP", (255, 165, 0)))
-
-    elif event_num == 6:
-        abnormal_states["reverse"] = False
-        abnormal_states["command_confusion"] = False
-        abnormal_states["speed_up"] = False
-        abnormal_states["shuffled_commands"] = {}
-        score_effects.append(ScoreEffect(WIDTH // 2, HEIGHT // 2, "RESET", (255, 255, 255)))
-    return grid
-
-
-# 衝突判定
-def check_collision(grid, shape, x, y):
-    for i, row in enumerate(shape):
-        for j, val in enumerate(row):
-            if val:
-                if x + j < 0 or x + j >= COLS or y + i >= ROWS:
-                    return True
-                if y + i >= 0 and grid[y + i][x + j]:
-                    return True
-    return False
-
-
-# ミノ着地
-def merge(grid, shape, x, y, color):
-    for i, row in enumerate(shape):
-        for j, val in enumerate(row):
-            if val and y + i >= 0:
-                grid[y + i][x + j] = color
-
-                
 # ミノ消滅描画補助
 def draw_entire_grid(screen, grid, current=None, reverse=False):
-    temp_surf = pygame.Surface((GRID_WIDTH, GRID_HEIGHT))
-    draw_game_grid(temp_surf, grid)
+    screen.fill(BLACK, (0, 0, GRID_WIDTH, GRID_HEIGHT))
+    draw_game_grid(screen, grid, reverse)
     if current:
-        for i, row in enumerate(current.shape):
-            for j, val in enumerate(row):
-                if val:
-                    pygame.draw.rect(temp_surf, current.color,
-                        ((current.x + j) * BLOCK_SIZE, (current.y + i) * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
-    if reverse:
-        temp_surf = pygame.transform.flip(temp_surf, False, True)
-    screen.blit(temp_surf, (0, 0))
+        for i, j in current.cells:
+            pygame.draw.rect(screen, current.color,
+                ((current.x + j) * BLOCK_SIZE, screen_row(current.y + i, reverse) * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
 
     
-# 揃えてミノ消滅
-def clear_lines(grid, screen, score_effects, score, abnormal_states):
-    new_grid = []
-    flashing_rows = []
-    for y, row in enumerate(grid):
-        if all(cell != 0 for cell in row):
-            flashing_rows.append(y)
-        else:
-            new_grid.append(row)
-
-    line_count = len(flashing_rows)
-    if line_count:
-        points = {1: 100, 2: 300, 3: 500, 4: 800}.get(line_count, 0)
-        score += points
-        effect = ScoreEffect(120, flashing_rows[0]*BLOCK_SIZE, f"+{points}", (255, 255, 0))
-        score_effects.append(effect)
-
-        for _ in range(3):
-            for y in flashing_rows:
-                grid[y] = [WHITE for _ in range(COLS)]
-            draw_entire_grid(screen, grid, reverse=abnormal_states.get("reverse", False))
-            pygame.display.flip()
-            pygame.time.delay(100)
+# グリッド線レイヤー(一度だけ描画して使い回す)
+_grid_overlay = None
 
-            for y in flashing_rows:
-                grid[y] = [0 for _ in range(COLS)]
-            draw_entire_grid(screen, grid, reverse=abnormal_states.get("reverse", False))
-            pygame.display.flip()
-            pygame.time.delay(100)
+def get_grid_overlay():
+    global _grid_overlay
+    if _grid_overlay is None:
+        overlay = pygame.Surface((GRID_WIDTH + 1, HEIGHT))
+        overlay.fill(BLACK)
+        overlay.set_colorkey(BLACK)
+        for x in range(COLS + 1):
+            pygame.draw.line(overlay, GRAY, (x * BLOCK_SIZE, 0), (x * BLOCK_SIZE, HEIGHT))
+        for y in range(ROWS):
+            pygame.draw.line(overlay, GRAY, (0, y * BLOCK_SIZE), (GRID_WIDTH, y * BLOCK_SIZE))
+        _grid_overlay = overlay
+    return _grid_overlay
 
-        for _ in flashing_rows:
-            new_grid.insert(0, [0 for _ in range(COLS)])
 
-    flashing = line_count > 0
-    return new_grid, score, flashing
+# 描画先の行(REVERSE状態なら上下反転した行に直接描く)
+def screen_row(y, reverse):
+    return ROWS - 1 - y if reverse else y
 
 
 # グリッドの描画
-def draw_game_grid(screen, grid):
+def draw_game_grid(screen, grid, reverse=False):
     for y, row in enumerate(grid):
+        sy = screen_row(y, reverse)
         for x, color in enumerate(row):
             if color:
-                pygame.draw.rect(screen, color, (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
-    for x in range(COLS + 1):
-        pygame.draw.line(screen, GRAY, (x * BLOCK_SIZE, 0), (x * BLOCK_SIZE, HEIGHT))
-    for y in range(ROWS):
-        pygame.draw.line(screen, GRAY, (0, y * BLOCK_SIZE), (GRID_WIDTH, y * BLOCK_SIZE))
+                pygame.draw.rect(screen, color, (x * BLOCK_SIZE, sy * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
+    screen.blit(get_grid_overlay(), (0, 0))
 
 
 def draw_simple_grid(screen, grid):
@@ -224,18 +157,151 @@ def draw_simple_grid(screen, grid):
                 pygame.draw.rect(screen, color, (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
 
 
-# ハードドロップ
-def hard_drop(grid, current):
-    while not check_collision(grid, current.shape, current.x, current.y + 1):
-        current.y += 1
-    merge(grid, current.shape, current.x, current.y, current.color)
-    return Tetrimino()
+# プレイフィールドの差分描画
+# 固定済みブロックとグリッド線は背景サーフェスに保持し、前フレームから変化したセルだけを画面に転送する
+class PlayfieldRenderer:
+    def __init__(self):
+        self.background = pygame.Surface((GRID_WIDTH, GRID_HEIGHT))
+        self.background.fill(BLACK)
+        self.cells = [[None] * COLS for _ in range(ROWS)]  # 背景に描画済みのセルの色
+        self.piece_cells = set()
+        self.ghost_cells = set()
+        self.full_redraw = True
+        self.reverse = False
+
+    # 次回の描画でプレイフィールド全体を転送させる
+    def invalidate(self):
+        self.full_redraw = True
+
+    def _paint_cell(self, x, y, color):
+        left, top = x * BLOCK_SIZE, screen_row(y, self.reverse) * BLOCK_SIZE
+        rect = (left, top, BLOCK_SIZE, BLOCK_SIZE)
+        self.background.fill(color or BLACK, rect)
+        self.background.blit(get_grid_overlay(), rect, rect)
+
+    # 固定済みグリッドの変化を背景へ反映し、変化したセルを返す
+    def _sync_background(self, grid):
+        changed = set()
+        for y, row in enumerate(grid):
+            drawn = self.cells[y]
+            if row == drawn:
+                continue
+            for x, color in enumerate(row):
+                if drawn[x] != color:
+                    self._paint_cell(x, y, color)
+                    drawn[x] = color
+                    changed.add((x, screen_row(y, self.reverse)))
+        return changed
+
+    # 描画して画面上の更新が必要な矩形のリストを返す(セル座標は画面上の行で扱う)
+    # ghost_yを渡すとその行に着地位置のプレビューを枠線で描く
+    def draw(self, screen, grid, current, reverse=False, ghost_y=None):
+        if reverse != self.reverse:
+            # 反転の切り替え時は背景を描き直す
+            self.reverse = reverse
+            self.cells = [[None] * COLS for _ in range(ROWS)]
+            self.full_redraw = True
+        changed = self._sync_background(grid)
+        piece_cells = set()
+        ghost_cells = set()
+        if current:
+            for i, j in current.cells:
+                if 0 <= current.y + i < ROWS:
+                    piece_cells.add((current.x + j, screen_row(current.y + i, reverse)))
+                if ghost_y is not None and 0 <= ghost_y + i < ROWS:
+                    ghost_cells.add((current.x + j, screen_row(ghost_y + i, reverse)))
+
+        if self.full_redraw:
+            screen.blit(self.background, (0, 0))
+            screen.blit(get_grid_overlay(), (GRID_WIDTH, 0), (GRID_WIDTH, 0, 1, HEIGHT))
+            rects = [pygame.Rect(0, 0, GRID_WIDTH + 1, HEIGHT)]
+            self.full_redraw = False
+        else:
+            dirty_cells = changed | self.piece_cells | piece_cells | self.ghost_cells | ghost_cells
+            rects = []
+            for x, y in dirty_cells:
+                rect = pygame.Rect(x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+                screen.blit(self.background, rect, rect)
+                rects.append(rect)
+
+        for x, y in ghost_cells - piece_cells:
+            pygame.draw.rect(screen, current.color, (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE), 2)
+        for x, y in piece_cells:
+            pygame.draw.rect(screen, current.color, (x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
+        self.ghost_cells = ghost_cells
+        self.piece_cells = piece_cells
+        return rects
+
+
+# パフォーマンス表示(FPS、フレーム時間、処理ごとの時間、ボタン/センサーと液晶の遅延)
+# 数値は毎フレーム変わるので文字列キャッシュは使わず、PERF_OVERLAY_INTERVALごとに描き直したサーフェスを転送する
+class PerfOverlay:
+    def __init__(self):
+        self.surface = pygame.Surface(PERF_OVERLAY_RECT.size)
+        self.updated = None
+
+    def update(self, frame_log, input_latencies, lcd_latencies):
+        now = pygame.time.get_ticks()
+        if self.updated is not None and now - self.updated < PERF_OVERLAY_INTERVAL:
+            return
+        self.updated = now
+        stats = frame_log.stats()
+
+        def ms(value):
+            return "-" if value is None else f"{value:.1f}"
+
+        lines = [
+            f"FPS {stats['fps']:.1f}  p50 {ms(stats['p50'])}  p99 {ms(stats['p99'])}",
+            f"logic {ms(stats['logic'])}  draw {ms(stats['draw'])}  flip {ms(stats['flip'])}",
+            f"gpio {ms(percentile(input_latencies, 50))}  lcd {ms(percentile(lcd_latencies, 50))} ms",
+        ]
+        font = get_font(FONT_NAME, 14)
+        self.surface.fill(BLACK)
+        for i, line in enumerate(lines):
+            self.surface.blit(font.render(line, True, (0, 255, 0)), (6, 2 + i * 15))
+
+    def draw(self, screen):
+        screen.blit(self.surface, PERF_OVERLAY_RECT)
+        return PERF_OVERLAY_RECT
+
+
+# 計測結果を分けるための状態異常の組み合わせ名
+def abnormal_label(abnormal_states):
+    active = [name for name in ("reverse", "command_confusion", "speed_up") if abnormal_states[name]]
+    return "+".join(active) or "normal"
+
+
+# フォント取得((名前, サイズ, 太字)ごとに一度だけ生成)
+_font_cache = {}
+
+def get_font(name, size, bold=False):
+    key = (name, size, bold)
+    font = _font_cache.get(key)
+    if font is None:
+        font = pygame.font.SysFont(name, size, bold=bold)
+        _font_cache[key] = font
+    return font
+
+
+# 文字列サーフェス取得(LRUキャッシュ、変化しないラベルは一度だけ描画)
+_text_cache = OrderedDict()
+
+def render_text(text, size, color=WHITE):
+    key = (text, size, color)
+    label = _text_cache.get(key)
+    if label is not None:
+        _text_cache.move_to_end(key)
+        return label
+    label = get_font(FONT_NAME, size, True).render(text, True, color)
+    _text_cache[key] = label
+    if len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return label
 
 
 # テキスト描画
 def draw_text(screen, text, size, x, y, color=WHITE):
-    font = pygame.font.SysFont("meiryo", size, bold=True)
-    label = font.render(text, True, color)
+    label = render_text(text, size, color)
     rect = label.get_rect(center=(x, y))
     screen.blit(label, rect)
 
@@ -249,11 +315,80 @@ def draw_button(screen, text, x, y, w, h, color, hover_color, mouse_pos):
     return rect, is_hover
 
 
-# サイド画面描画
-def draw_side_panel(screen, mouse_pos, next_mino, change_count, score, abnormal_states):
-    panel_x = GRID_WIDTH + 10
-    draw_text(screen, "Controls", 24, panel_x + 90, 40)
-    
+# ハイスコアの一覧(entriesはScoreStore.topの結果)
+def draw_high_scores(screen, title, entries, rows, x, y):
+    draw_text(screen, title, 22, x, y, (255, 255, 0))
+    for rank in range(rows):
+        text = f"{rank + 1}. {entries[rank][0]}" if rank < len(entries) else f"{rank + 1}. ---"
+        draw_text(screen, text, 20, x, y + 26 * (rank + 1))
+
+
+# 対戦相手の盤面と接続状態(incomingはまだせり上がっていないおじゃまブロックの行数)
+def draw_rival_panel(screen, versus, incoming):
+    rival = versus.rival
+    screen.fill(BLACK, RIVAL_RECT)
+    pygame.draw.line(screen, GRAY, (WIDTH, 0), (WIDTH, HEIGHT))
+    center_x = RIVAL_RECT.centerx
+    draw_text(screen, "RIVAL", 24, center_x, 30)
+
+    left = WIDTH + (RIVAL_PANEL_WIDTH - COLS * RIVAL_BLOCK_SIZE) // 2
+    top = 60
+    size = RIVAL_BLOCK_SIZE
+    for y, row in enumerate(rival.grid):
+        for x, color in enumerate(row):
+            if color:
+                pygame.draw.rect(screen, color, (left + x * size, top + y * size, size, size))
+    piece = rival.piece
+    if piece:
+        for i, j in piece.cells:
+            if piece.y + i >= 0:
+                pygame.draw.rect(screen, piece.color, (left + (piece.x + j) * size, top + (piece.y + i) * size, size, size))
+    pygame.draw.rect(screen, GRAY, (left - 1, top - 1, COLS * size + 2, ROWS * size + 2), 1)
+
+    bottom = top + ROWS * size
+    draw_text(screen, f"Score: {rival.score}", 20, center_x, bottom + 30, (255, 255, 0))
+    draw_text(screen, f"Lines: {rival.lines}", 20, center_x, bottom + 60)
+    draw_text(screen, versus.status(), 20, center_x, bottom + 90)
+    if incoming:
+        draw_text(screen, f"INCOMING: {incoming}", 20, center_x, bottom + 120, (255, 0, 0))
+    ping = versus.ping()
+    if ping is not None:
+        draw_text(screen, f"PING {ping}ms", 16, center_x, HEIGHT - 20)
+    return RIVAL_RECT
+
+
+# 状態ごとの目標フレームレート
+def frame_rate_for(game_state):
+    if ADAPTIVE_FPS and game_state != "play":
+        return IDLE_FPS
+    return TARGET_FPS
+
+
+# 画面生成(VSYNC指定時は対応していなければ通常の画面にフォールバック)
+def create_screen(width=WIDTH):
+    if VSYNC:
+        try:
+            return pygame.display.set_mode((width, HEIGHT), pygame.SCALED, vsync=1)
+        except pygame.error:
+            pass
+    return pygame.display.set_mode((width, HEIGHT))
+
+
+# サイド画面の固定部分(操作説明とPAUSEボタン)
+# 内容が変わるのはCOMMAND CONFUSIONの"???"表示とボタンのホバー状態だけなので、その組み合わせごとに一度だけ描画する
+_panel_layers = {}
+
+def get_panel_layer(confused, is_hover):
+    key = (confused, is_hover)
+    layer = _panel_layers.get(key)
+    if layer is not None:
+        return layer
+
+    layer = pygame.Surface((PANEL_RECT[2], PANEL_RECT[3]))
+    layer.fill(BLACK)
+    center_x = GRID_WIDTH + 100 - PANEL_RECT[0]  # パネル中央(panel_x + 90)のレイヤー上の座標
+    draw_text(layer, "Controls", 24, center_x, 40)
+
     cmd_display = {
         "←": "←",
         "→": "→",
@@ -261,7 +396,7 @@ def draw_side_panel(screen, mouse_pos, next_mino, change_count, score, abnormal_
         "↑": "↑",
         "SPACE": "SPACE"
     }
-    if abnormal_states["command_confusion"]:
+    if confused:
         for k in cmd_display.keys():
             cmd_display[k] = "???"
 
@@ -274,12 +409,23 @@ def draw_side_panel(screen, mouse_pos, next_mino, change_count, score, abnormal_
         "ESC: Pause"
     ]
     for i, line in enumerate(instructions):
-        draw_text(screen, line, 18, panel_x + 90, 80 + i * 30)
+        draw_text(layer, line, 18, center_x, 80 + i * 30)
 
-    pause_btn, is_hover = draw_button(screen, "PAUSE", panel_x + 20, 250, 150, 40, GRAY, (150, 150, 150), mouse_pos)
+    button = PAUSE_BUTTON_RECT.move(-PANEL_RECT[0], 0)
+    pygame.draw.rect(layer, (150, 150, 150) if is_hover else GRAY, button)
+    draw_text(layer, "PAUSE", 24, button.centerx, button.centery)
+
+    draw_text(layer, "Next:", 20, center_x, 330)
+    _panel_layers[key] = layer
+    return layer
+
+
+# サイド画面描画
+def draw_side_panel(screen, mouse_pos, next_mino, change_count, score, abnormal_states):
+    panel_x = GRID_WIDTH + 10
+    is_hover = PAUSE_BUTTON_RECT.collidepoint(mouse_pos)
+    screen.blit(get_panel_layer(abnormal_states["command_confusion"], is_hover), PANEL_RECT[:2])
 
-    draw_text(screen, "Next:", 20, panel_x + 90, 330)
-    
     next_shape = next_mino.shape
     shape_width = len(next_shape[0])
     shape_height = len(next_shape)
@@ -295,48 +441,108 @@ def draw_side_panel(screen, mouse_pos, next_mino, change_count, score, abnormal_
     draw_text(screen, f"Change: {change_count}/3", 28, panel_x + 90, 480)
     draw_text(screen, f"Score: {score}", 28, panel_x + 90, 530, (255, 255, 0))
 
-    return pause_btn, is_hover
+    return PAUSE_BUTTON_RECT, is_hover
 
 
 
 
 
-def main():
+# backendを省略するとcreate_backend()で選ぶ(hardware.py参照)
+# seedを指定すると毎ゲーム同じ出現順・イベントになる、randomizerは"uniform"か"bag"
+# record_pathを指定すると入力をリプレイとして記録する
+# replayにreplay.load()の結果を渡すと、入力の代わりに記録を実時間で再生する
+# perf_overlayはパフォーマンス表示の初期状態、frame_log_pathを指定するとゲームオーバー時と終了時にフレームごとの時間を追記する
+# profile_pathを指定すると処理区間ごとの時間を計測して終了時に保存する(profiler.py参照)
+# autoplayならコンピュータが続けて遊ぶ(負荷試験用、autoplay_intervalは操作の間隔msで0なら毎フレーム)
+# scoresを渡すと人が遊んだゲームの結果を保存し、タイトル画面とゲームオーバー画面にハイスコアを表示する(scores.py参照)
+# versusを渡すと対戦モードになり、相手の盤面を右に表示しておじゃまブロックをやり取りする(versus.py参照)
+def main(backend=None, seed=None, randomizer="uniform", record_path=None, replay=None,
+         perf_overlay=False, frame_log_path=None, profile_path=None,
+         autoplay=False, autoplay_interval=AI_ACTION_INTERVAL, scores=None, versus=None):
     pygame.init()
-    LCD1602.init(0x3f, 1)
-    LCD1602.write(0, 0, "Score: 0")
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    screen = create_screen(WIDTH + RIVAL_PANEL_WIDTH if versus else WIDTH)
+    if backend is None:
+        backend = create_backend()
+    lcd = LcdWriter(backend)
+    lcd.write(0, "Score: 0")
     clock = pygame.time.Clock()
-    grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
-    current = Tetrimino()
-    next_mino = Tetrimino()
-    change_count = 3
-    fall_time = 0
-    NORMAL_FALL_SPEED = 500
-    fall_speed = NORMAL_FALL_SPEED
+    renderer = PlayfieldRenderer()
+    panel_key = None  # 前回描画したサイド画面の内容
+    rival_key = None  # 前回描画した対戦相手の表示内容
+    versus_result = None  # 対戦の結果("YOU WIN"/"YOU LOSE")
+    game = Game(seed=seed, randomizer=randomizer)
+    logic_lag = 0
+    logic_step = LOGIC_STEP
     game_state = "start"
     running = True
-    score = 0
     score_effects = []
-    btn_held = False
-    global previous_pir_state
-
-    # 状態異常管理用辞書
-    abnormal_states = {
-        "reverse": False,
-        "command_confusion": False,
-        "speed_up": False,
-        "shuffled_commands": {}
-    }
-
-    # オリジナルコマンドキー（左、右、下、上、スペース）
-    original_commands = {
-        pygame.K_LEFT: pygame.K_LEFT,
-        pygame.K_RIGHT: pygame.K_RIGHT,
-        pygame.K_DOWN: pygame.K_DOWN,
-        pygame.K_UP: pygame.K_UP,
-        pygame.K_SPACE: pygame.K_SPACE,
-    }
+    recorder = ReplayWriter(record_path) if record_path else None
+    replay_games = list(replay) if replay is not None else None
+    player = None  # 再生中のReplayPlayer
+    replay_wait = 0  # 再生時・自動プレイ時にゲームオーバー画面を表示している時間
+    auto_advance = replay_games is not None or autoplay  # ゲームオーバー後に自動で次のゲームを始めるか
+    autoplayer = None  # コンピュータのプレイヤー(ai.AutoPlayer、初めて使うときに生成)
+    controller = None  # このゲームを操作しているコンピュータ(人が遊んでいればNone)
+    demo = False       # タイトル画面のデモ中か
+    idle_time = 0      # タイトル画面で操作がない時間
+    ai_time = 0
+    started_at = None  # 人が遊んでいるゲームの開始時刻(保存済みまたはコンピュータのゲームならNone)
+    new_record = False
+    frame_log = FrameLog()
+    overlay = PerfOverlay()
+    show_overlay = perf_overlay
+    prof = Profiler() if profile_path else NullProfiler()
+    prof.instrument(engine, "clear_lines")
+    prof.instrument(engine, "trigger_random_event")
+
+    # ゲーム開始(再生時は次の記録を開始、デモは記録しない)
+    def start_game(is_demo=False):
+        nonlocal logic_step, player, autoplayer, controller, demo, ai_time, started_at
+        if versus:
+            versus.stop()
+        demo = is_demo
+        controller = None
+        ai_time = 0
+        started_at = None
+        if demo or autoplay:
+            if autoplayer is None:
+                from ai import AutoPlayer
+                autoplayer = AutoPlayer()
+            controller = autoplayer
+        if replay_games is not None:
+            recorded = replay_games.pop(0)
+            game.randomizer = recorded.randomizer
+            game.reset(recorded.seed)
+            logic_step = recorded.step
+            player = ReplayPlayer(recorded)
+        elif demo:
+            game.reset()
+        else:
+            game.reset(seed)
+            if recorder:
+                recorder.start(game, logic_step)
+            if not autoplay:
+                started_at = time.time()
+            if versus:
+                versus.start(game)
+        update_lcd_score(game.score)
+        score_effects.clear()
+
+    # 人が遊んだゲームの結果を保存(書き込みはScoreStoreのスレッドで行う)
+    def save_score(finished):
+        nonlocal started_at, new_record
+        if scores is None or started_at is None:
+            return
+        best = scores.top("all")
+        new_record = finished and game.score > 0 and (not best or game.score > best[0][0])
+        scores.record(game.score, game.lines, game.pieces, game.seed, started_at, finished)
+        started_at = None
+
+    # 入力を記録してからゲームに与える
+    def play_input(name):
+        if recorder:
+            recorder.record(game.ticks, name)
+        apply_input(game, name)
 
     # スコアエフェクト追加用の簡易関数
     def add_score_effect(score_effects, text, color):
@@ -347,139 +553,195 @@ def main():
         if not hasattr(update_lcd_score, "last_score"):
             update_lcd_score.last_score = -1
         if update_lcd_score.last_score != score:
-            LCD1602.write(0, 0, f"Score: {score:<10}")
+            lcd.write(0, f"Score: {score:<10}")
             update_lcd_score.last_score = score
 
+    # 2行目に消去ライン数と状態異常(R: REVERSE, C: COMMAND CONFUSION, S: SPEED UP)を表示
+    def update_lcd_status(game):
+        states = game.abnormal_states
+        status = (game.lines, states["reverse"], states["command_confusion"], states["speed_up"])
+        if getattr(update_lcd_status, "last_status", None) != status:
+            flags = "".join(flag for flag, active in zip("RCS", status[1:]) if active)
+            lcd.write(1, f"Lines:{game.lines:<6}{flags:>4}")
+            update_lcd_status.last_status = status
+
+    # ゲーム終了(ゲームオーバーか対戦で相手が先にゲームオーバーになったとき)
+    def finish_game():
+        nonlocal game_state, versus_result
+        game_state = "gameover"
+        if versus:
+            versus_result = versus.result() if versus.active else None
+            versus.stop()
+        if recorder:
+            recorder.end(game.ticks)
+        save_score(True)
+        if frame_log_path:
+            frame_log.dump(frame_log_path)
+
+    # ゲームからの通知をエフェクトに変換
+    def handle_game_events():
+        for kind, value in game.drain_events():
+            if kind == "lines":
+                rows, points = value
+                score_effects.append(ScoreEffect(120, rows[0] * BLOCK_SIZE, f"+{points}", (255, 255, 0)))
+                if versus:
+                    versus.lines_cleared(len(rows))
+            elif kind == "random_event":
+                add_score_effect(score_effects, value, EVENT_COLORS[value])
+            elif kind == "change":
+                add_score_effect(score_effects, "CHANGE", (255, 255, 0))
+            elif kind == "garbage":
+                add_score_effect(score_effects, f"+{value} LINES", EVENT_COLORS["+ BLOCKS"])
+            elif kind == "game_over":
+                finish_game()
+
 
     while running:
-        dt = clock.tick()
+        dt = clock.tick(frame_rate_for(game_state))
+        frame_start = logic_end = time.perf_counter()
         mouse_pos = pygame.mouse.get_pos()
-        screen.fill(BLACK)
+        dirty_rects = None  # Noneなら画面全体を更新
+        menu = game_state != "play"
+        if menu:
+            prof.set_context(game_state)
+        else:
+            prof.set_context(game_state, abnormal_label(game.abnormal_states))
+        # ボタンとセンサーの入力はプレイ中以外は捨てる
+        prof.begin("events")
+        hw_events = backend.poll_events()
+        prof.end()
+        # 対戦相手との送受信はどの画面でも続ける(届いたおじゃまブロックは入力として記録する)
+        if versus:
+            prof.begin("versus")
+            for _ in range(versus.update(dt)):
+                play_input("garbage")
+            prof.end()
+        if menu:
+            prof.begin("menu")
+            screen.fill(BLACK)
+            renderer.invalidate()
+            panel_key = None
+
+        if game_state == "start" and replay_games is not None:
+            if replay_games:
+                start_game()
+                game_state = "play"
+            else:
+                running = False
 
-        if game_state == "start":
+        elif game_state == "start" and autoplay:
+            start_game()
+            game_state = "play"
+
+        elif game_state == "start":
             draw_text(screen, "TETRIS", 60, WIDTH // 2, HEIGHT // 3)
             start_btn, hover = draw_button(screen, "Play", WIDTH // 2 - 75, HEIGHT // 2, 150, 50, GRAY, (180, 180, 180), mouse_pos)
+            if scores:
+                draw_high_scores(screen, "HIGH SCORES", scores.top("all"), TITLE_SCORE_ROWS, WIDTH // 4, HEIGHT // 2 + 90)
+                draw_high_scores(screen, "TODAY", scores.top("daily"), TITLE_SCORE_ROWS, WIDTH * 3 // 4, HEIGHT // 2 + 90)
+            idle_time += dt
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
-                elif event.type == pygame.MOUSEBUTTONDOWN and hover:
-                    grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
-                    current = Tetrimino()
-                    next_mino = Tetrimino()
-                    change_count = 3
-                    score = 0
-                    score_effects.clear()
-                    # 状態異常リセット
-                    for k in abnormal_states:
-                        if k != "shuffled_commands":
-                            abnormal_states[k] = False
-                    abnormal_states["shuffled_commands"] = {}
-                    fall_speed = NORMAL_FALL_SPEED
-                    game_state = "play"
+                elif event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
+                    idle_time = 0
+                    if event.type == pygame.MOUSEBUTTONDOWN and hover:
+                        start_game()
+                        game_state = "play"
+            # しばらく操作がなければコンピュータが遊ぶデモを始める
+            if game_state == "start" and ATTRACT_DELAY and idle_time >= ATTRACT_DELAY:
+                start_game(is_demo=True)
+                game_state = "play"
 
         elif game_state == "play":
-            fall_time += dt
-            current_pir_state = GPIO.input(PIR_PIN)
-            if current_pir_state == 1 and previous_pir_state == 0:
-                grid = trigger_random_event(grid, score_effects, abnormal_states, NORMAL_FALL_SPEED)
-            previous_pir_state = current_pir_state
-                
-            # SPEED UP状態なら速度を半分に
-            current_fall_speed = fall_speed // 2 if abnormal_states["speed_up"] else fall_speed
-
-            if btn.value and change_count > 0 and not btn_held:
-                current, next_mino = next_mino, Tetrimino()
-                change_count -= 1
-                add_score_effect(score_effects, "CHANGE", (255, 255, 0))
-                btn_held = True
-            elif not btn.value:
-                btn_held = False
-
-            if fall_time > current_fall_speed:
-                if not check_collision(grid, current.shape, current.x, current.y + 1):
-                    current.y += 1
-                else:
-                    merge(grid, current.shape, current.x, current.y, current.color)
-                    score += 10
-                    update_lcd_score(score)
-                    grid, score, flashing = clear_lines(grid, screen, score_effects, score, abnormal_states)
-                    current = next_mino
-                    next_mino = Tetrimino()
-                    if check_collision(grid, current.shape, current.x, current.y):
-                        game_state = "gameover"
-                fall_time = 0
-
+            logic_lag = min(logic_lag + dt, MAX_LOGIC_LAG)
+            prof.begin("events")
+            if player is None and not demo:
+                for device in hw_events:
+                    play_input("change" if device == "button" else device)
+            if controller:
+                interval = AI_ACTION_INTERVAL if demo else autoplay_interval
+                ai_time += dt
+                while ai_time >= interval:
+                    ai_time -= interval
+                    action = controller.next_action(game)
+                    if action:
+                        play_input(action)
+                    if interval <= 0:
+                        break
+            prof.end()
+
+            # 描画とは独立した固定間隔で落下処理を進める
+            prof.begin("step")
+            while logic_lag >= logic_step and not game.game_over:
+                if player:
+                    player.feed(game)
+                logic_lag -= logic_step
+                game.step(logic_step)
+            prof.end()
+
+            prof.begin("events")
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
+                elif demo and event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
+                    # デモ中は何か操作したらタイトルに戻る
+                    game_state = "start"
+                    idle_time = 0
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         game_state = "pause"
-
-                    # COMMAND CONFUSION時はキー操作をシャッフル辞書に基づいて入れ替え
-                    def get_mapped_key(k):
-                        if abnormal_states["command_confusion"] and k in abnormal_states["shuffled_commands"]:
-                            return abnormal_states["shuffled_commands"][k]
-                        return k
-
-                    k = event.key
-                    mapped_key = get_mapped_key(k)
-
-                    if mapped_key == pygame.K_LEFT:
-                        if not check_collision(grid, current.shape, current.x - 1, current.y):
-                            current.x -= 1
-                    elif mapped_key == pygame.K_RIGHT:
-                        if not check_collision(grid, current.shape, current.x + 1, current.y):
-                            current.x += 1
-                    elif mapped_key == pygame.K_DOWN:
-                        if not check_collision(grid, current.shape, current.x, current.y + 1):
-                            current.y += 1
-                    elif mapped_key == pygame.K_SPACE:
-                        current = hard_drop(grid, current)
-                        score += 10
-                        update_lcd_score(score)
-                        grid, score, flashing = clear_lines(grid, screen, score_effects, score, abnormal_states)
-                        update_lcd_score(score)
-                        if flashing and abnormal_states["reverse"]:
-                            pygame.display.flip()
-                            pygame.time.delay(300)
-                        current = next_mino
-                        next_mino = Tetrimino()
-                        if check_collision(grid, current.shape, current.x, current.y):
-                            game_state = "gameover"
-                        fall_time = 0
-                    elif mapped_key == pygame.K_UP:
-                        rotated = [list(row) for row in zip(*current.shape[::-1])]
-                        if not check_collision(grid, rotated, current.x, current.y):
-                            current.shape = rotated
-                            
-
-            # REVERSE状態なら描画を上下反転
-            if abnormal_states["reverse"]:
-                # 画面上下反転
-                temp_surf = pygame.Surface((GRID_WIDTH, GRID_HEIGHT))
-                draw_game_grid(temp_surf, grid)
-                for i, row in enumerate(current.shape):
-                    for j, val in enumerate(row):
-                        if val:
-                            pygame.draw.rect(temp_surf, current.color,
-                                ((current.x + j) * BLOCK_SIZE, (current.y + i) * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
-                screen.blit(pygame.transform.flip(temp_surf, False, True), (0, 0))
-            else:
-                draw_game_grid(screen, grid)
-                for i, row in enumerate(current.shape):
-                    for j, val in enumerate(row):
-                        if val:
-                            pygame.draw.rect(screen, current.color,
-                                ((current.x + j) * BLOCK_SIZE, (current.y + i) * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE))
-
-            pause_btn, is_hover = draw_side_panel(screen, mouse_pos, next_mino, change_count, score, abnormal_states)
-            if pygame.mouse.get_pressed()[0] and is_hover:
+                    elif event.key == PERF_OVERLAY_KEY:
+                        show_overlay = not show_overlay
+                        panel_key = None
+                    elif event.key in KEY_ACTIONS and player is None and controller is None:
+                        play_input(KEY_ACTIONS[event.key])
+
+            handle_game_events()
+            if versus and game_state == "play" and versus.won():
+                finish_game()
+            if player and game_state == "play" and player.finished(game):
+                game_state = "start"
+            if recorder:
+                recorder.flush()  # 異常終了してもこのフレームまでの入力がリプレイに残る
+            update_lcd_score(game.score)
+            update_lcd_status(game)
+            prof.end()
+            logic_end = time.perf_counter()
+
+            prof.begin("draw")
+
+            # エフェクトはプレイフィールドに重なるので表示中は全体を描き直す
+            if score_effects:
+                renderer.invalidate()
+                panel_key = None
+
+            # REVERSE状態なら行を上下反転して描画
+            abnormal_states = game.abnormal_states
+            current = game.active_piece
+            ghost_y = game.ghost_y() if GHOST_PIECE and current else None
+            dirty_rects = renderer.draw(screen, game.grid, current, abnormal_states["reverse"], ghost_y)
+
+            # サイド画面は表示内容が変わったときだけ描き直す
+            is_hover = PAUSE_BUTTON_RECT.collidepoint(mouse_pos)
+            new_panel_key = (abnormal_states["command_confusion"], is_hover,
+                             game.next_mino.kind, game.change_count, game.score)
+            if new_panel_key != panel_key:
+                pause_btn, is_hover = draw_side_panel(screen, mouse_pos, game.next_mino, game.change_count, game.score, abnormal_states)
+                if dirty_rects is not None:
+                    dirty_rects.append(PANEL_RECT)
+                panel_key = new_panel_key
+            if pygame.mouse.get_pressed()[0] and is_hover and game_state == "play" and not demo:
                 game_state = "pause"
+            prof.end()
 
+            prof.begin("effects")
+            if score_effects:
+                dirty_rects = None
             for effect in score_effects[:]:
                 if not effect.draw(screen):
                     score_effects.remove(effect)
+            prof.end()
 
         elif game_state == "pause":
             draw_text(screen, "PAUSED", 40, WIDTH // 2, HEIGHT // 3)
@@ -493,41 +755,124 @@ def main():
                         game_state = "play"
                     elif h2:
                         game_state = "start"
+                        if recorder:
+                            recorder.end(game.ticks)
+                        save_score(False)
+                        if versus:
+                            versus.stop()
+
+        elif game_state == "gameover" and demo:
+            demo = False
+            idle_time = 0
+            game_state = "start"
 
         elif game_state == "gameover":
-            draw_text(screen, "GAME OVER", 40, WIDTH // 2, HEIGHT // 3)
-            draw_text(screen, f"Final Score: {score}", 28, WIDTH // 2, HEIGHT // 3 + 50, (255, 255, 0))
+            draw_text(screen, versus_result or "GAME OVER", 40, WIDTH // 2, HEIGHT // 3)
+            draw_text(screen, f"Final Score: {game.score}", 28, WIDTH // 2, HEIGHT // 3 + 50, (255, 255, 0))
             retry_btn, h1 = draw_button(screen, "Retry", WIDTH // 2 - 75, HEIGHT // 2 + 10, 150, 40, GRAY, (150,150,150), mouse_pos)
             title_btn, h2 = draw_button(screen, "Back to Title", WIDTH // 2 - 75, HEIGHT // 2 + 60, 150, 40, GRAY, (150,150,150), mouse_pos)
+            if scores:
+                if new_record:
+                    draw_text(screen, "NEW RECORD!", 32, WIDTH // 2, HEIGHT // 3 - 50, (255, 165, 0))
+                draw_high_scores(screen, "TODAY", scores.top("daily"), GAMEOVER_SCORE_ROWS, WIDTH // 4, HEIGHT // 2 + 130)
+                draw_high_scores(screen, "THIS CABINET", scores.top("cabinet"), GAMEOVER_SCORE_ROWS, WIDTH * 3 // 4, HEIGHT // 2 + 130)
+            # 再生時・自動プレイ時は少し表示してから次のゲームへ
+            if auto_advance:
+                replay_wait += dt
+                if replay_wait >= REPLAY_GAMEOVER_WAIT:
+                    replay_wait = 0
+                    game_state = "start"
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if h1:
-                        grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
-                        current = Tetrimino()
-                        next_mino = Tetrimino()
-                        change_count = 3
-                        score = 0
-                        update_lcd_score(score)
-                        score_effects.clear()
-                        # 状態異常リセット
-                        for k in abnormal_states:
-                            if k != "shuffled_commands":
-                                abnormal_states[k] = False
-                        abnormal_states["shuffled_commands"] = {}
-                        fall_speed = NORMAL_FALL_SPEED
+                        start_game()
                         game_state = "play"
                     elif h2:
                         game_state = "start"
 
-        pygame.display.flip()
+        if menu:
+            prof.end()
+
+        if versus:
+            new_rival_key = (versus.rival.version, versus.status(), game.pending_garbage, versus.ping())
+            if menu or new_rival_key != rival_key:
+                rect = draw_rival_panel(screen, versus, game.pending_garbage)
+                if dirty_rects is not None:
+                    dirty_rects.append(rect)
+                rival_key = new_rival_key
+
+        if show_overlay:
+            prof.begin("overlay")
+            overlay.update(frame_log, backend.latencies, lcd.latencies)
+            rect = overlay.draw(screen)
+            if dirty_rects is not None:
+                dirty_rects.append(rect)
+            prof.end()
+
+        draw_end = time.perf_counter()
+        prof.begin("display")
+        backend.present()
+        if dirty_rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty_rects)
+        prof.end()
+        frame_log.add(game_state, dt, logic_end - frame_start, draw_end - logic_end, time.perf_counter() - draw_end)
 
+    lcd.close()  # 残りの書き込みを終えてから画面を閉じる
     pygame.quit()
-    GPIO.cleanup()
+    if game_state in ("play", "pause"):
+        save_score(False)
+    prof.restore()
+    if profile_path:
+        prof.save(profile_path)
+        prof.summary()
+    if autoplayer:
+        autoplayer.close()
+    if recorder:
+        recorder.close()
+    if frame_log_path:
+        frame_log.dump(frame_log_path)
+    if scores:
+        scores.close()
+    if versus:
+        versus.close()
+    backend.close()
     
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["auto"] + list(BACKENDS), default=None,
+                        help="入出力バックエンド(省略時は環境変数TETRIS_BACKEND、なければauto)")
+    parser.add_argument("--seed", type=int, default=None, help="乱数の種(省略時は毎回ランダム)")
+    parser.add_argument("--randomizer", choices=PieceGenerator.MODES, default="uniform",
+                        help="ミノの出現方式(uniform: 等確率、bag: 7種1組)")
+    parser.add_argument("--record-dir", default="replays", help="リプレイの保存先")
+    parser.add_argument("--no-record", action="store_true", help="リプレイを記録しない")
+    parser.add_argument("--replay", default=None, help="記録したリプレイを実時間で再生する")
+    parser.add_argument("--perf", action="store_true", help="パフォーマンス表示をオンにして起動する(F3キーで切り替え)")
+    parser.add_argument("--frame-log", default=None, help="フレームごとの時間を追記するCSVファイル")
+    parser.add_argument("--autoplay", action="store_true", help="コンピュータに遊ばせる(負荷試験用)")
+    parser.add_argument("--autoplay-interval", type=int, default=AI_ACTION_INTERVAL,
+                        help="コンピュータの操作の間隔(ms、0なら毎フレーム)")
+    parser.add_argument("--profile", default=None,
+                        help="処理区間ごとの時間の保存先(.profならcProfile互換、それ以外はflamegraph用のスタック形式)")
+    parser.add_argument("--scores", default="scores.db", help="ハイスコアとプレイ履歴の保存先(SQLite)")
+    parser.add_argument("--no-scores", action="store_true", help="ハイスコアを保存・表示しない")
+    parser.add_argument("--cabinet", default=None,
+                        help="筐体の名前(省略時は環境変数TETRIS_CABINET、なければホスト名)")
+    parser.add_argument("--versus", default=None, help="対戦相手の筐体(ホスト:ポート)、指定すると対戦モードになる")
+    parser.add_argument("--versus-port", type=int, default=DEFAULT_PORT, help="対戦モードで自分が受信するポート")
+    args = parser.parse_args()
+    record_path = None
+    if not args.no_record and not args.replay:
+        record_path = os.path.join(args.record_dir, time.strftime("%Y%m%d-%H%M%S") + ".trpl")
+    replay = load_replay(args.replay) if args.replay else None
+    scores = None if args.no_scores else ScoreStore(args.scores, args.cabinet)
+    versus = Versus(Link(args.versus, args.versus_port)) if args.versus else None
+    main(create_backend(args.backend), args.seed, args.randomizer, record_path, replay, args.perf, args.frame_log,
+         args.profile, args.autoplay, args.autoplay_interval, scores, versus)
 
 
 
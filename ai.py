@@ -0,0 +1,226 @@
+# コンピュータのプレイヤー(タイトル画面のデモと高速な負荷試験用)
+# 今のミノの置き場所ごとに次のミノ(next_mino)の最善の置き場所まで読み、合計の評価が最も良い手を選ぶ
+# ミノチェンジが残っていれば、入れ替えた順(next_mino→その次)で読んだ方が十分良いときだけ使う
+# 1段目の候補を分けてプロセスプールで並列に読み、盤面の評価と2段目の結果はプロセスごとにキャッシュして次の手でも使う
+# プールを使うときは読みを投げておいて毎フレーム結果を確かめるだけなので、描画ループは読み終わるのを待たない
+# (結果が出るまでの間もミノは落ち続ける)
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BitBoard
+from engine import Tetrimino
+from policies import DEFAULT_WEIGHTS, evaluate, key_for, placements, place, plan_actions
+
+EVAL_CACHE_SIZE = 50000   # 評価値をキャッシュする盤面の数
+CHANGE_MARGIN = 3.0       # ミノチェンジを使うのに必要な評価値の差
+MIN_PARALLEL = 8          # これより候補が少なければ並列にしない
+
+
+# 盤面の評価(消した行数を除く)のキャッシュ、キーは各行のビット列
+_eval_cache = OrderedDict()
+# 盤面と次のミノの種類 -> 次のミノを最善に置いたときの評価値
+_best_cache = OrderedDict()
+
+
+def _cache_get(cache, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _cache_put(cache, key, value):
+    cache[key] = value
+    if len(cache) > EVAL_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+# 積み上がりの高さ・穴・凸凹による評価(policies.evaluateの消した行数の項を除いたもの)
+def board_value(board, weights):
+    key = tuple(board.bits)
+    value = _cache_get(_eval_cache, key)
+    if value is None:
+        value = evaluate(board, 0, weights)
+        _cache_put(_eval_cache, key, value)
+    return value
+
+
+# kindのミノを出現位置から置いたときの最善の評価値(置けなければNone)
+def best_value(board, kind, weights):
+    key = (tuple(board.bits), kind)
+    if key in _best_cache:
+        _best_cache.move_to_end(key)
+        return _best_cache[key]
+    piece = Tetrimino(kind)
+    best = None
+    for _, shift, y, state in placements(board, piece):
+        after, lines = place(board, state, piece.x + shift, y, piece.color)
+        value = board_value(after, weights) + weights["lines"] * lines
+        if best is None or value > best:
+            best = value
+    _cache_put(_best_cache, key, best)
+    return best
+
+
+# 置き場所の候補のうちindexesの番目を評価する(プロセスプールから呼ばれる)
+# next_kindがNoneなら1手だけ読む
+def search(board, kind, rotation, x, y, next_kind, indexes, weights):
+    piece = Tetrimino(kind)
+    piece.rotation, piece.x, piece.y = rotation, x, y
+    candidates = placements(board, piece)
+    results = []
+    for i in indexes:
+        turns, shift, land, state = candidates[i]
+        after, lines = place(board, state, x + shift, land, piece.color)
+        value = weights["lines"] * lines
+        if next_kind is None:
+            value += board_value(after, weights)
+        else:
+            following = best_value(after, next_kind, weights)
+            if following is None:
+                value += board_value(after, weights) - 1000  # 次のミノが置けない(ゲームオーバー)
+            else:
+                value += following
+        results.append((value, i))
+    return results
+
+
+# プールのプロセスの起動方法
+# 描画ループのプロセスでは液晶やハイスコアのスレッドが動いているので、forkせずに新しいプロセスから起動する
+def pool_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+# 読みの途中の状態(読み始めた時点の盤面とミノの写し、名前 -> (ミノ, futureのリスト))
+class PendingSearch:
+    def __init__(self, board, searches):
+        self.board = board
+        self.searches = searches
+
+    def done(self):
+        return all(future.done() for _, futures in self.searches.values() for future in futures)
+
+    def cancel(self):
+        for _, futures in self.searches.values():
+            for future in futures:
+                future.cancel()
+
+
+class AutoPlayer:
+    # workers: 読みに使うプロセス数(0ならプールを使わずにその場で読む、Noneならコア数)
+    def __init__(self, weights=None, lookahead=True, use_change=True, workers=None):
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.lookahead = lookahead
+        self.use_change = use_change
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(workers, mp_context=pool_context()) if workers > 0 else None
+        self.workers = workers
+        self.piece = None
+        self.plan = []
+        self.pending = None
+
+    # 読む対象: 名前 -> (ミノ, 1手先のミノ)、"change"はミノチェンジした場合
+    def targets(self, game):
+        piece = Tetrimino(game.current.kind)
+        piece.rotation, piece.x, piece.y = game.current.rotation, game.current.x, game.current.y
+        next_kind = game.next_mino.kind if self.lookahead else None
+        targets = {"move": (piece, next_kind)}
+        if self.use_change and game.change_count > 0:
+            # 入れ替えると今のミノがnext_minoになり、その次のミノがnext_minoになる
+            upcoming = game.upcoming(1) if self.lookahead else []
+            targets["change"] = (Tetrimino(game.next_mino.kind), upcoming[0] if upcoming else None)
+        return targets
+
+    # 読みをプールに投げる(候補を分けてプロセスごとに1つのfutureにする)
+    def submit(self, board, piece, next_kind):
+        count = len(placements(board, piece))
+        args = (board, piece.kind, piece.rotation, piece.x, piece.y, next_kind)
+        parts = self.workers if count >= MIN_PARALLEL else 1
+        chunks = [range(n, count, parts) for n in range(parts)]
+        return [self.pool.submit(search, *args, list(chunk), self.weights) for chunk in chunks if chunk]
+
+    # 評価の結果から最善の(評価値, 回転回数, 左右の移動量)、置けなければNone
+    def pick(self, board, piece, results):
+        if not results:
+            return None
+        value, index = max(results)
+        turns, shift, _, _ = placements(board, piece)[index]
+        return value, turns, shift
+
+    # pieceの置き方の最善(評価値, 回転回数, 左右の移動量)、next_kindは1手先のミノ
+    def best_move(self, board, piece, next_kind):
+        if self.pool:
+            results = [r for future in self.submit(board, piece, next_kind) for r in future.result()]
+        else:
+            count = len(placements(board, piece))
+            results = search(board, piece.kind, piece.rotation, piece.x, piece.y, next_kind,
+                             range(count), self.weights)
+        return self.pick(board, piece, results)
+
+    # 読みの結果(名前 -> best_moveの結果)から操作列を決める
+    def decide(self, moves):
+        move = moves["move"]
+        changed = moves.get("change")
+        if changed and (move is None or changed[0] > move[0] + CHANGE_MARGIN):
+            return ["change"]
+        if move is None:
+            return ["drop"]
+        return plan_actions(move[1], move[2])
+
+    # 操作中のミノの操作列を決める(読み終わるまで待つ)
+    def choose(self, game):
+        board = BitBoard.from_grid(game.grid)
+        moves = {name: self.best_move(board, piece, next_kind)
+                 for name, (piece, next_kind) in self.targets(game).items()}
+        return self.decide(moves)
+
+    # 読みを投げておき、結果はnext_actionで受け取る
+    def start_search(self, game):
+        board = BitBoard.from_grid(game.grid)
+        searches = {name: (piece, self.submit(board, piece, next_kind))
+                    for name, (piece, next_kind) in self.targets(game).items()}
+        return PendingSearch(board, searches)
+
+    def finish_search(self, pending):
+        moves = {}
+        for name, (piece, futures) in pending.searches.items():
+            results = [r for future in futures for r in future.result()]
+            moves[name] = self.pick(pending.board, piece, results)
+        return self.decide(moves)
+
+    # 次の操作(プールを使うときは読み終わるまでNoneを返し続ける)
+    def next_action(self, game):
+        if game.active_piece is None:
+            return None
+        if game.current is not self.piece:
+            self.piece = game.current
+            self.plan = []
+            if self.pending:
+                self.pending.cancel()
+                self.pending = None
+            if self.pool:
+                self.pending = self.start_search(game)
+            else:
+                self.plan = self.choose(game)
+        if self.pending:
+            if not self.pending.done():
+                return None
+            self.plan = self.finish_search(self.pending)
+            self.pending = None
+        if not self.plan:
+            return None
+        action = self.plan.pop(0)
+        return action if action == "change" else key_for(game, action)
+
+    def close(self):
+        if self.pending:
+            self.pending.cancel()
+            self.pending = None
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
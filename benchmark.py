@@ -0,0 +1,343 @@
+# エンジンと描画の処理時間の計測
+# 盤面(空・半分・天井間際)と状態異常(なし・REVERSE・COMMAND CONFUSION)の組み合わせごとに各処理を繰り返し実行し、
+# 1秒あたりの実行回数と1回あたりの時間の分位点をJSONで出力する
+# 描画はSDLのダミードライバで画面外のサーフェスに行う
+#   python benchmark.py -o result.json             # 計測して保存
+#   python benchmark.py --compare old.json         # 以前の結果と比べる(比が1より大きければ遅くなった)
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # 起動メッセージが標準出力のJSONに混ざらないように
+
+import pygame
+
+from engine import (COLS, ROWS, GRAY, MINOS, Tetrimino, check_collision, clear_lines, collapse_lines,
+                    column_tops, hard_drop, merge, new_abnormal_states, new_grid)
+import TETRIS
+
+BOARDS = ("empty", "half", "topout")
+STATES = ("normal", "reverse", "confusion")
+PERCENTILES = (50, 90, 99)
+
+
+# 計測用の盤面(同じ名前なら毎回同じ盤面になる)
+#   empty:  空
+#   half:   下半分が埋まっていて最下段だけ揃っている
+#   topout: 上から3段目まで積み上がっていて下2段が揃っている
+def make_board(name, seed=0):
+    rng = random.Random(seed)
+    grid = new_grid()
+    if name == "empty":
+        return grid
+    height, full = {"half": (ROWS // 2, 1), "topout": (ROWS - 2, 2)}[name]
+    for y in range(ROWS - height, ROWS):
+        color = MINOS[rng.randrange(len(MINOS))][1]
+        grid[y] = [color] * COLS
+        if y < ROWS - full:
+            grid[y][rng.randrange(COLS)] = 0
+    return grid
+
+
+def make_abnormal_states(name):
+    states = new_abnormal_states()
+    if name == "reverse":
+        states["reverse"] = True
+    elif name == "confusion":
+        states["command_confusion"] = True
+    return states
+
+
+# 盤面上で取りうるミノの位置(全種類・全回転・全列、出現位置と着地位置)
+def piece_positions(grid):
+    tops = column_tops(grid)
+    positions = []
+    for kind in range(len(MINOS)):
+        piece = Tetrimino(kind)
+        for rotation in range(4):
+            piece.rotation = rotation
+            for x in range(-piece.state.width, COLS):
+                piece.x = x
+                positions.append((piece.cells, x, 0))
+                if not check_collision(grid, piece.cells, x, 0):
+                    piece.y = 0
+                    hard_drop([row[:] for row in grid], piece, tops[:])
+                    positions.append((piece.cells, x, piece.y))
+    return positions
+
+
+# 計測する処理
+# 各関数は(盤面, 状態異常, 描画先)を受け取り、setup(n)を返す
+# setup(n)は計測外で呼ばれ、(処理, 引数のリスト)を返す(処理を引数ごとに1回呼んだ時間を計る)
+def bench_check_collision(grid, states, screen):
+    positions = piece_positions(grid)
+
+    def setup(n):
+        return check_collision, [(grid,) + positions[i % len(positions)] for i in range(n)]
+    return setup
+
+
+def bench_merge(grid, states, screen):
+    # 着地位置だけを使う(空きがなければ出現位置)
+    positions = [p for p in piece_positions(grid) if p[2] > 0 and not check_collision(grid, *p)]
+    positions = positions or [(Tetrimino(0).cells, 3, 0)]
+
+    def setup(n):
+        args = []
+        for i in range(n):
+            cells, x, y = positions[i % len(positions)]
+            args.append(([row[:] for row in grid], cells, x, y, GRAY, column_tops(grid)))
+        return merge, args
+    return setup
+
+
+def bench_clear_lines(grid, states, screen):
+    def setup(n):
+        return clear_lines, [(grid,)] * n
+    return setup
+
+
+# 揃った行の検出と取り除き(揃った行がなければ検出だけ)
+def bench_collapse_lines(grid, states, screen):
+    tops = column_tops(grid)
+
+    def clear(grid, tops):
+        rows, _ = clear_lines(grid)
+        if rows:
+            collapse_lines(grid, rows, tops)
+
+    def setup(n):
+        return clear, [(grid, tops[:]) for _ in range(n)]
+    return setup
+
+
+def bench_hard_drop(grid, states, screen):
+    tops = column_tops(grid)
+    pieces = []
+    for kind in range(len(MINOS)):
+        for x in range(COLS):
+            piece = Tetrimino(kind)
+            piece.x = x
+            if not check_collision(grid, piece.cells, piece.x, piece.y):
+                pieces.append(piece)
+
+    def setup(n):
+        args = []
+        for i in range(n):
+            piece = pieces[i % len(pieces)] if pieces else Tetrimino(0)
+            current = Tetrimino(piece.kind)
+            current.x, current.y = piece.x, piece.y
+            args.append(([row[:] for row in grid], current, tops[:]))
+        return hard_drop, args
+    return setup
+
+
+def bench_draw_game_grid(grid, states, screen):
+    def setup(n):
+        return TETRIS.draw_game_grid, [(screen, grid, states["reverse"])] * n
+    return setup
+
+
+def bench_draw_side_panel(grid, states, screen):
+    next_mino = Tetrimino(0)
+    mouse_pos = (0, 0)
+
+    def setup(n):
+        return TETRIS.draw_side_panel, [(screen, mouse_pos, next_mino, 3, score * 10, states) for score in range(n)]
+    return setup
+
+
+def bench_score_effect(grid, states, screen):
+    def setup(n):
+        effect = TETRIS.ScoreEffect(TETRIS.WIDTH // 2, TETRIS.HEIGHT // 2, "+100", (255, 255, 0), duration=10 ** 9)
+        return TETRIS.ScoreEffect.draw, [(effect, screen)] * n
+    return setup
+
+
+# 各ミノを各列で出現位置から着地位置まで1マスずつ落とした(ミノ, 着地位置の行)の並び
+def falling_pieces(grid):
+    tops = column_tops(grid)
+    frames = []
+    for kind in range(len(MINOS)):
+        for x in range(COLS):
+            landed = Tetrimino(kind)
+            landed.x = x
+            if check_collision(grid, landed.cells, x, 0):
+                continue
+            hard_drop([row[:] for row in grid], landed, tops[:])
+            for y in range(landed.y + 1):
+                piece = Tetrimino(kind)
+                piece.x, piece.y = x, y
+                frames.append((piece, landed.y))
+    return frames or [(Tetrimino(0), None)]
+
+
+# 落下中のミノを動かしながらのプレイフィールドの差分描画(ゴーストあり)
+# 盤面の背景への反映は計測前に済ませるので、ゲーム中の毎フレームの描画(変化したセルの転送)を計る
+def bench_renderer(grid, states, screen):
+    renderer = TETRIS.PlayfieldRenderer()
+    frames = falling_pieces(grid)
+    renderer.draw(screen, grid, None, states["reverse"])
+
+    def setup(n):
+        args = []
+        for i in range(n):
+            piece, ghost_y = frames[i % len(frames)]
+            args.append((screen, grid, piece, states["reverse"], ghost_y))
+        return renderer.draw, args
+    return setup
+
+
+# 1フレーム分の描画(ゲームと同じくプレイフィールドは差分描画、サイド画面は毎回描き直す最悪の場合)
+def bench_frame(grid, states, screen):
+    renderer = TETRIS.PlayfieldRenderer()
+    frames = falling_pieces(grid)
+    renderer.draw(screen, grid, None, states["reverse"])
+    next_mino = Tetrimino(1)
+    mouse_pos = (0, 0)
+
+    def frame(piece, ghost_y, score):
+        renderer.draw(screen, grid, piece, states["reverse"], ghost_y)
+        TETRIS.draw_side_panel(screen, mouse_pos, next_mino, 3, score, states)
+
+    def setup(n):
+        return frame, [frames[i % len(frames)] + (i * 10,) for i in range(n)]
+    return setup
+
+
+# エフェクト表示中の1フレーム分の描画(ゲームと同じくプレイフィールド全体を転送し直す)
+def bench_frame_effect(grid, states, screen):
+    renderer = TETRIS.PlayfieldRenderer()
+    piece, ghost_y = falling_pieces(grid)[0]
+    next_mino = Tetrimino(1)
+    mouse_pos = (0, 0)
+
+    def frame(effect, score):
+        renderer.invalidate()
+        renderer.draw(screen, grid, piece, states["reverse"], ghost_y)
+        TETRIS.draw_side_panel(screen, mouse_pos, next_mino, 3, score, states)
+        effect.draw(screen)
+
+    def setup(n):
+        effect = TETRIS.ScoreEffect(TETRIS.WIDTH // 2, TETRIS.HEIGHT // 2, "+100", (255, 255, 0), duration=10 ** 9)
+        return frame, [(effect, score * 10) for score in range(n)]
+    return setup
+
+
+# 名前 -> (計測関数, 1サンプルあたりの実行回数)
+BENCHMARKS = {
+    "check_collision": (bench_check_collision, 1000),
+    "merge": (bench_merge, 500),
+    "clear_lines": (bench_clear_lines, 500),
+    "collapse_lines": (bench_collapse_lines, 500),
+    "hard_drop": (bench_hard_drop, 500),
+    "draw_game_grid": (bench_draw_game_grid, 20),
+    "PlayfieldRenderer.draw": (bench_renderer, 200),
+    "draw_side_panel": (bench_draw_side_panel, 20),
+    "ScoreEffect.draw": (bench_score_effect, 200),
+    "frame": (bench_frame, 20),
+    "frame_effect": (bench_frame_effect, 1),
+}
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# setupの処理をnumber回ずつrepeatサンプル計測し、1回あたりの時間(マイクロ秒)の統計を返す
+def measure(setup, number, repeat, warmup=2):
+    for _ in range(warmup):
+        func, args = setup(number)
+        for a in args:
+            func(*a)
+    samples = []
+    perf_counter = time.perf_counter
+    for _ in range(repeat):
+        func, args = setup(number)
+        start = perf_counter()
+        for a in args:
+            func(*a)
+        samples.append((perf_counter() - start) / number * 1e6)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    result = {
+        "number": number,
+        "repeat": repeat,
+        "ops_per_sec": 1e6 / mean if mean else None,
+        "mean_us": mean,
+        "min_us": samples[0],
+        "max_us": samples[-1],
+    }
+    for p in PERCENTILES:
+        result[f"p{p}_us"] = percentile(samples, p)
+    return result
+
+
+def run(names=None, boards=BOARDS, states=STATES, repeat=50, scale=1.0):
+    pygame.init()
+    screen = pygame.Surface((TETRIS.WIDTH, TETRIS.HEIGHT))
+    results = []
+    for name in names or BENCHMARKS:
+        bench, number = BENCHMARKS[name]
+        number = max(1, int(number * scale))
+        for board in boards:
+            grid = make_board(board)
+            for state in states:
+                result = {"name": name, "board": board, "state": state}
+                result.update(measure(bench(grid, make_abnormal_states(state), screen), number, repeat))
+                results.append(result)
+    pygame.quit()
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+# 以前の結果と比べた1回あたりの時間の比(p50)
+def compare(old, new):
+    old_results = {(r["name"], r["board"], r["state"]): r for r in old["results"]}
+    rows = []
+    for r in new["results"]:
+        key = (r["name"], r["board"], r["state"])
+        if key in old_results and old_results[key]["p50_us"]:
+            rows.append(key + (r["p50_us"] / old_results[key]["p50_us"],))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="エンジンと描画の処理時間を計測する")
+    parser.add_argument("names", nargs="*", help="計測する処理(省略時はすべて): " + ", ".join(BENCHMARKS))
+    parser.add_argument("--board", action="append", choices=BOARDS, help="盤面(複数指定可)")
+    parser.add_argument("--state", action="append", choices=STATES, help="状態異常(複数指定可)")
+    parser.add_argument("--repeat", type=int, default=50, help="サンプル数")
+    parser.add_argument("--scale", type=float, default=1.0, help="1サンプルあたりの実行回数の倍率")
+    parser.add_argument("-o", "--output", default=None, help="結果の保存先(省略時は標準出力)")
+    parser.add_argument("--compare", default=None, help="比べる以前の結果")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmark: " + ", ".join(unknown))
+
+    report = run(args.names, args.board or BOARDS, args.state or STATES, args.repeat, args.scale)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        for name, board, state, ratio in compare(old, report):
+            print(f"{name:<18}{board:<8}{state:<11}{ratio:6.2f}", file=sys.stderr)
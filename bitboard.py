@@ -0,0 +1,199 @@
+# ビットボード版の盤面
+# 各行の占有状態を1つの整数(ビットx = 列x)で持ち、色は別のbytearrayにパレット番号で持つ
+# 衝突判定・固定・揃った行の検出が整数のAND/ORだけで済むので、AIやシミュレーション向け
+
+COLS = 10
+ROWS = 20
+
+
+# 色とパレット番号の対応(0は空きマス)
+PALETTE = [0]
+_palette_index = {0: 0}
+
+def color_index(color):
+    index = _palette_index.get(color)
+    if index is None:
+        index = len(PALETTE)
+        PALETTE.append(color)
+        _palette_index[color] = index
+    return index
+
+
+# ミノ形状をビット列に変換したもの
+# masks: 各行のビット列(左端を列0とする)
+# left, right: ブロックがある最小の列と最大の列+1
+# bottom: ブロックがある最後の行+1
+# bottoms: 列ごとの最下段のブロック(列, 行)
+class PieceMasks:
+    __slots__ = ("masks", "left", "right", "bottom", "bottoms")
+
+    def __init__(self, masks, left, right, bottom, bottoms):
+        self.masks = masks
+        self.left = left
+        self.right = right
+        self.bottom = bottom
+        self.bottoms = bottoms
+
+
+_piece_cache = {}
+
+def encode_shape(shape):
+    key = tuple(tuple(row) for row in shape)
+    piece = _piece_cache.get(key)
+    if piece is not None:
+        return piece
+
+    masks = []
+    lowest = {}
+    bottom = 0
+    for i, row in enumerate(key):
+        mask = 0
+        for j, val in enumerate(row):
+            if val:
+                mask |= 1 << j
+                lowest[j] = i
+                bottom = i + 1
+        masks.append(mask)
+    bottoms = tuple(sorted(lowest.items()))
+    piece = PieceMasks(tuple(masks[:bottom]), bottoms[0][0], bottoms[-1][0] + 1, bottom, bottoms)
+    _piece_cache[key] = piece
+    return piece
+
+
+class BitBoard:
+    def __init__(self, cols=COLS, rows=ROWS):
+        self.cols = cols
+        self.rows = rows
+        self.full_mask = (1 << cols) - 1
+        self.bits = [0] * rows
+        self.colors = bytearray(cols * rows)
+        self.tops = [rows] * cols  # 列ごとの最上段のブロックの行(空の列はrows)
+
+    # リストのリスト形式のグリッドから生成
+    @classmethod
+    def from_grid(cls, grid):
+        board = cls(len(grid[0]), len(grid))
+        for y, row in enumerate(grid):
+            bits = 0
+            for x, color in enumerate(row):
+                if color:
+                    bits |= 1 << x
+                    board.colors[y * board.cols + x] = color_index(color)
+            board.bits[y] = bits
+        board.tops = board.column_tops()
+        return board
+
+    # リストのリスト形式のグリッドに変換
+    def to_grid(self):
+        grid = []
+        for y in range(self.rows):
+            offset = y * self.cols
+            grid.append([PALETTE[c] for c in self.colors[offset:offset + self.cols]])
+        return grid
+
+    def copy(self):
+        board = BitBoard.__new__(BitBoard)
+        board.cols = self.cols
+        board.rows = self.rows
+        board.full_mask = self.full_mask
+        board.bits = self.bits[:]
+        board.colors = self.colors[:]
+        board.tops = self.tops[:]
+        return board
+
+    # 盤面の占有状態を表すハッシュ可能な値(色は含まない)
+    def key(self):
+        return tuple(self.bits)
+
+    # 列ごとの最上段を盤面から数え直す
+    def column_tops(self):
+        tops = [self.rows] * self.cols
+        seen = 0
+        for y, bits in enumerate(self.bits):
+            new = bits & ~seen
+            if not new:
+                continue
+            seen |= new
+            while new:
+                low = new & -new
+                tops[low.bit_length() - 1] = y
+                new ^= low
+            if seen == self.full_mask:
+                break
+        return tops
+
+    # 着地位置の行
+    # 全列で最上段より上にあれば列の高さから直接求め、せり出しの下にあるときだけ1段ずつ調べる
+    def drop_y(self, piece, x, y):
+        tops = self.tops
+        landing = self.rows
+        for j, bottom in piece.bottoms:
+            top = tops[x + j]
+            if top <= y + bottom:
+                while not self.collides(piece, x, y + 1):
+                    y += 1
+                return y
+            landing = min(landing, top - bottom - 1)
+        return landing
+
+    # 衝突判定(pieceはencode_shapeの結果)
+    def collides(self, piece, x, y):
+        if x + piece.left < 0 or x + piece.right > self.cols or y + piece.bottom > self.rows:
+            return True
+        bits = self.bits
+        for i, mask in enumerate(piece.masks):
+            if mask and y + i >= 0 and bits[y + i] & (mask << x):
+                return True
+        return False
+
+    # ミノ着地
+    def merge(self, piece, x, y, color):
+        index = color_index(color)
+        bits = self.bits
+        colors = self.colors
+        tops = self.tops
+        for i, mask in enumerate(piece.masks):
+            row = y + i
+            if row < 0 or not mask:
+                continue
+            bits[row] |= mask << x
+            offset = row * self.cols + x
+            j = 0
+            while mask:
+                if mask & 1:
+                    colors[offset + j] = index
+                    if row < tops[x + j]:
+                        tops[x + j] = row
+                mask >>= 1
+                j += 1
+
+    # 揃った行の番号
+    def full_rows(self):
+        full = self.full_mask
+        return [y for y, bits in enumerate(self.bits) if bits == full]
+
+    # 指定した行を取り除いて上に空行を詰める
+    def clear_rows(self, rows):
+        if not rows:
+            return 0
+        removed = set(rows)
+        cols = self.cols
+        keep = [y for y in range(self.rows) if y not in removed]
+        count = len(rows)
+        self.bits = [0] * count + [self.bits[y] for y in keep]
+        colors = bytearray(cols * count)
+        for y in keep:
+            colors += self.colors[y * cols:(y + 1) * cols]
+        self.colors = colors
+        self.tops = self.column_tops()
+        return count
+
+    # 穴の位置を指定しておじゃまブロックを1行せり上げる(最上段の行は押し出される)
+    def add_garbage_row(self, hole, color):
+        index = color_index(color)
+        cols = self.cols
+        self.bits = self.bits[1:] + [self.full_mask & ~(1 << hole)]
+        row = bytearray([index]) * cols
+        row[hole] = 0
+        self.colors = self.colors[cols:] + row
+        self.tops = self.column_tops()
@@ -0,0 +1,530 @@
+# テトリスのゲームロジック(pygameやGPIOに依存しない)
+# 盤面・ミノ・得点・状態異常を扱い、Game.apply_action()とGame.step()で進める
+import random
+from collections import deque
+from bitboard import encode_shape
+
+
+# 盤面サイズ
+COLS = 10
+ROWS = 20
+
+
+# 色の定義
+GRAY = (100, 100, 100)
+WHITE = (255, 255, 255)
+
+
+# テトリミノの定義
+MINOS = [
+    ([[1, 1, 1, 1]], (0, 255, 255)),         # I
+    ([[1, 0, 0], [1, 1, 1]], (0, 0, 255)),   # J
+    ([[0, 0, 1], [1, 1, 1]], (255, 165, 0)), # L
+    ([[1, 1], [1, 1]], (255, 255, 0)),       # O
+    ([[0, 1, 1], [1, 1, 0]], (0, 255, 0)),   # S
+    ([[0, 1, 0], [1, 1, 1]], (128, 0, 128)), # T
+    ([[1, 1, 0], [0, 1, 1]], (255, 0, 0)),   # Z
+]
+
+
+# 得点・速度設定
+LINE_SCORES = {1: 100, 2: 300, 3: 500, 4: 800}
+LOCK_SCORE = 10          # ミノ固定ごとの得点
+NORMAL_FALL_SPEED = 500  # 1段落下するまでの時間(ms)
+MAX_CHANGES = 3          # ミノチェンジの回数
+LINE_FLASH_COUNT = 3     # ライン消去時の点滅回数
+LINE_FLASH_INTERVAL = 100  # 点滅の切り替え間隔(ms)
+LOOKAHEAD = 7            # 先読みしておくミノの数
+
+
+# ランダムイベント(番号はtrigger_random_event内の分岐と対応)と発生しやすさ
+# 重みがすべて等しければ等確率で選ぶ
+EVENT_NAMES = {1: "+ BLOCKS", 2: "CLEAN UP", 3: "REVERSE", 4: "COMMAND CONFUSION", 5: "SPEED UP", 6: "RESET"}
+EVENT_WEIGHTS = {name: 1 for name in EVENT_NAMES.values()}
+
+
+# 操作(COMMAND CONFUSIONで入れ替わるのはこの5つ)
+ACTIONS = ["left", "right", "down", "rotate", "drop"]
+
+
+# 回転状態ごとの形状(変更不可のタプル)、ブロックのセル座標、外接矩形、ビットボード用のビット列
+class Rotation:
+    __slots__ = ("shape", "cells", "bottoms", "width", "height", "masks")
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.cells = tuple((i, j) for i, row in enumerate(shape) for j, val in enumerate(row) if val)
+        # 列ごとの最下段のブロック(列, 行)
+        self.bottoms = tuple((j, max(i for i, jj in self.cells if jj == j))
+                             for j in sorted({j for _, j in self.cells}))
+        self.width = len(shape[0])
+        self.height = len(shape)
+        self.masks = encode_shape(shape)
+
+
+# 回転テーブル(右回転4方向を起動時に一度だけ計算)
+def build_rotations(shape):
+    states = []
+    shape = tuple(tuple(row) for row in shape)
+    for _ in range(4):
+        states.append(Rotation(shape))
+        shape = tuple(zip(*shape[::-1]))
+    return tuple(states)
+
+ROTATIONS = tuple(build_rotations(shape) for shape, _ in MINOS)
+
+
+class Tetrimino:
+    def __init__(self, kind=None):
+        self.kind = random.randrange(len(MINOS)) if kind is None else kind
+        self.rotation = 0
+        self.color = MINOS[self.kind][1]
+        self.x = COLS // 2 - self.state.width // 2
+        self.y = 0
+
+    @property
+    def state(self):
+        return ROTATIONS[self.kind][self.rotation]
+
+    @property
+    def shape(self):
+        return ROTATIONS[self.kind][self.rotation].shape
+
+    @property
+    def cells(self):
+        return ROTATIONS[self.kind][self.rotation].cells
+
+    # 右回転した回転番号と状態
+    def rotated(self):
+        rotation = (self.rotation + 1) % 4
+        return rotation, ROTATIONS[self.kind][rotation]
+
+    def rotate(self):
+        self.rotation = (self.rotation + 1) % 4
+
+
+# ミノの出現順
+#   uniform: 毎回7種から等確率で選ぶ
+#   bag:     7種を1組にしてシャッフルし、組を使い切るまで同じミノが出ない
+# 出現順はまとめて生成してlookahead個以上を常に先読みしておく
+class PieceGenerator:
+    MODES = ("uniform", "bag")
+
+    def __init__(self, rng, mode="uniform", lookahead=LOOKAHEAD):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown randomizer: {mode}")
+        self.rng = rng
+        self.mode = mode
+        self.lookahead = lookahead
+        self.queue = deque()
+        self._fill()
+
+    def _fill(self):
+        while len(self.queue) < self.lookahead:
+            if self.mode == "bag":
+                bag = list(range(len(MINOS)))
+                self.rng.shuffle(bag)
+                self.queue.extend(bag)
+            else:
+                randrange = self.rng.randrange
+                self.queue.extend(randrange(len(MINOS)) for _ in range(self.lookahead))
+
+    def next_kind(self):
+        kind = self.queue.popleft()
+        if len(self.queue) < self.lookahead:
+            self._fill()
+        return kind
+
+    # この後に出るミノの種類(取り出さない)
+    def peek(self, count):
+        return [self.queue[i] for i in range(min(count, len(self.queue)))]
+
+
+def new_grid():
+    return [[0 for _ in range(COLS)] for _ in range(ROWS)]
+
+
+# 状態異常管理用辞書
+def new_abnormal_states():
+    return {
+        "reverse": False,
+        "command_confusion": False,
+        "speed_up": False,
+        "shuffled_commands": {}
+    }
+
+
+# ランダムイベント発生処理
+# 発生したイベント名と新しいグリッドを返す、topsを渡すと列ごとの最上段の索引もあわせて更新する
+# rngを渡すとその乱数でイベントを選ぶ(再現用)
+def trigger_random_event(grid, abnormal_states, tops=None, rng=random):
+    abnormal_active = any([
+        abnormal_states["reverse"],
+        abnormal_states["command_confusion"],
+        abnormal_states["speed_up"]
+    ])
+    available_abnormal_events = []
+    if not abnormal_states["reverse"]:
+        available_abnormal_events.append(3)
+    if not abnormal_states["command_confusion"]:
+        available_abnormal_events.append(4)
+    if not abnormal_states["speed_up"]:
+        available_abnormal_events.append(5)
+    possible_events = [1, 2]
+    if abnormal_active:
+        possible_events.append(6)
+    possible_events.extend(available_abnormal_events)
+    weights = [EVENT_WEIGHTS[EVENT_NAMES[num]] for num in possible_events]
+    if len(set(weights)) == 1:
+        event_num = rng.choice(possible_events)
+    else:
+        event_num = rng.choices(possible_events, weights)[0]
+
+    if event_num == 1:
+        add_garbage_rows(grid, [rng.randint(0, COLS - 1) for _ in range(3)], tops)
+        return grid, "+ BLOCKS"
+
+    elif event_num == 2:
+        grid = new_grid()
+        if tops is not None:
+            tops[:] = [ROWS] * COLS
+        return grid, "CLEAN UP"
+
+    elif event_num == 3:
+        abnormal_states["reverse"] = True
+        return grid, "REVERSE"
+
+    elif event_num == 4:
+        abnormal_states["command_confusion"] = True
+        shuffled = ACTIONS[:]
+        while True:
+            rng.shuffle(shuffled)
+            if any(k != s for k, s in zip(ACTIONS, shuffled)):
+                break
+        abnormal_states["shuffled_commands"] = dict(zip(ACTIONS, shuffled))
+        return grid, "COMMAND CONFUSION"
+
+    elif event_num == 5:
+        abnormal_states["speed_up"] = True
+        return grid, "SPEED UP"
+
+    abnormal_states["reverse"] = False
+    abnormal_states["command_confusion"] = False
+    abnormal_states["speed_up"] = False
+    abnormal_states["shuffled_commands"] = {}
+    return grid, "RESET"
+
+
+# 列ごとの最上段のブロックの行(空の列はROWS)
+def column_tops(grid):
+    tops = [ROWS] * COLS
+    for y in range(ROWS - 1, -1, -1):
+        for x, color in enumerate(grid[y]):
+            if color:
+                tops[x] = y
+    return tops
+
+
+# おじゃまブロックが1行せり上がった後の最上段の更新
+def shift_tops_up(grid, tops):
+    for x in range(COLS):
+        if tops[x] == ROWS:
+            tops[x] = ROWS - 1 if grid[ROWS - 1][x] else ROWS
+        elif tops[x] > 0:
+            tops[x] -= 1
+        else:
+            # 最上段のブロックが押し出されたので列を探し直す
+            tops[x] = next((y for y in range(ROWS) if grid[y][x]), ROWS)
+
+
+# おじゃまブロックを下からせり上げる(holesは1行ごとの穴の列)
+def add_garbage_rows(grid, holes, tops=None):
+    for hole_pos in holes:
+        new_row = [GRAY if i != hole_pos else 0 for i in range(COLS)]
+        grid.pop(0)
+        grid.append(new_row)
+        if tops is not None:
+            shift_tops_up(grid, tops)
+    return grid
+
+
+# 着地位置の行
+# ミノが全列で最上段より上にあれば列の高さから直接求め、せり出しの下に入り込んでいるときだけ1段ずつ調べる
+def drop_position(grid, tops, current):
+    y = ROWS
+    for j, bottom in current.state.bottoms:
+        top = tops[current.x + j]
+        if top <= current.y + bottom:
+            y = current.y
+            while not check_collision(grid, current.cells, current.x, y + 1):
+                y += 1
+            return y
+        y = min(y, top - bottom - 1)
+    return y
+
+
+# 衝突判定
+def check_collision(grid, cells, x, y):
+    for i, j in cells:
+        if x + j < 0 or x + j >= COLS or y + i >= ROWS:
+            return True
+        if y + i >= 0 and grid[y + i][x + j]:
+            return True
+    return False
+
+
+# ミノ着地
+def merge(grid, cells, x, y, color, tops=None):
+    for i, j in cells:
+        if y + i >= 0:
+            grid[y + i][x + j] = color
+            if tops is not None and y + i < tops[x + j]:
+                tops[x + j] = y + i
+
+
+# 揃った行の検出と得点
+def clear_lines(grid):
+    flashing_rows = [y for y, row in enumerate(grid) if all(cell != 0 for cell in row)]
+    return flashing_rows, LINE_SCORES.get(len(flashing_rows), 0)
+
+
+# 揃った行を取り除いて上に空行を詰める
+def collapse_lines(grid, rows, tops=None):
+    removed = set(rows)
+    if tops is not None:
+        # 残る行のうち列の最上段のブロックは、その下で消えた行の数だけ下にずれる
+        for x in range(COLS):
+            top = next((y for y in range(tops[x], ROWS) if y not in removed and grid[y][x]), ROWS)
+            tops[x] = top + sum(1 for y in rows if y > top) if top < ROWS else ROWS
+    new_grid = [row for y, row in enumerate(grid) if y not in removed]
+    for _ in rows:
+        new_grid.insert(0, [0 for _ in range(COLS)])
+    return new_grid
+
+
+# ミノ消滅アニメーション
+# 白と空白を交互に点滅させ、終了までゲームを止めずに時間を進める
+class LineClearAnimation:
+    def __init__(self, rows):
+        self.rows = rows
+        self.elapsed = 0
+        self.phase = -1
+
+    # 時間を進めて点滅状態をグリッドに反映する、終了したらTrue
+    def update(self, grid, dt):
+        self.elapsed += dt
+        phase = self.elapsed // LINE_FLASH_INTERVAL
+        if phase >= LINE_FLASH_COUNT * 2:
+            return True
+        if phase != self.phase:
+            self.phase = phase
+            fill = WHITE if phase % 2 == 0 else 0
+            for y in self.rows:
+                grid[y] = [fill for _ in range(COLS)]
+        return False
+
+
+# ハードドロップ
+def hard_drop(grid, current, tops=None):
+    if tops is not None:
+        current.y = drop_position(grid, tops, current)
+    else:
+        while not check_collision(grid, current.cells, current.x, current.y + 1):
+            current.y += 1
+    merge(grid, current.cells, current.x, current.y, current.color, tops)
+
+
+# 1ゲーム分の状態
+# 入力はapply_action()、時間経過はstep()で与え、表示側への通知はevents(種類, 値)に溜める
+#   ("lines", (消えた行, 得点)) / ("random_event", イベント名) / ("change", None) / ("game_over", None)
+#   ("garbage", せり上がった行数)
+# animate_line_clears=Falseなら点滅を待たずにすぐ行を詰める(シミュレーション用)
+# seedを指定すると出現順とランダムイベントが再現される、randomizerはPieceGeneratorのモード
+class Game:
+    def __init__(self, animate_line_clears=True, seed=None, randomizer="uniform"):
+        self.animate_line_clears = animate_line_clears
+        self.randomizer = randomizer
+        self.reset(seed)
+
+    # seedを省略すると毎回別のゲームになる
+    def reset(self, seed=None):
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.seed)  # ランダムイベント用
+        self.generator = PieceGenerator(random.Random(self.rng.getrandbits(64)), self.randomizer)
+        self.grid = new_grid()
+        self.tops = [ROWS] * COLS  # 列ごとの最上段のブロックの行
+        self.current = self.new_piece()
+        self.next_mino = self.new_piece()
+        self.change_count = MAX_CHANGES
+        self.score = 0
+        self.lines = 0
+        self.pieces = 0
+        self.ticks = 0  # step()を呼んだ回数(リプレイの時刻)
+        self.fall_time = 0
+        self.fall_speed = NORMAL_FALL_SPEED
+        self.abnormal_states = new_abnormal_states()
+        self.line_clear = None  # ライン消去アニメーション中ならLineClearAnimation
+        self.pending_events = 0  # アニメーション中に受け付けたセンサーイベント数
+        self.pending_changes = 0  # アニメーション中に受け付けたミノチェンジの数
+        self.pending_garbage = 0  # 対戦相手から送られてまだせり上がっていないおじゃまブロックの行数
+        self.game_over = False
+        self.events = []
+
+    def new_piece(self):
+        return Tetrimino(self.generator.next_kind())
+
+    # next_minoより後に出るミノの種類
+    def upcoming(self, count=LOOKAHEAD):
+        return self.generator.peek(count)
+
+    # 溜まった通知を取り出す
+    def drain_events(self):
+        events = self.events
+        self.events = []
+        return events
+
+    # 操作中のミノ(消去アニメーション中やゲームオーバー後はNone)
+    @property
+    def active_piece(self):
+        if self.line_clear or self.game_over:
+            return None
+        return self.current
+
+    # SPEED UP状態なら速度を半分に
+    def current_fall_speed(self):
+        return self.fall_speed // 2 if self.abnormal_states["speed_up"] else self.fall_speed
+
+    def ghost_y(self):
+        return drop_position(self.grid, self.tops, self.current)
+
+    # 次のミノを出現させ、置けなければゲームオーバー
+    def spawn_next(self):
+        self.current = self.next_mino
+        self.next_mino = self.new_piece()
+        if check_collision(self.grid, self.current.cells, self.current.x, self.current.y):
+            self.game_over = True
+            self.events.append(("game_over", None))
+
+    # ミノ固定後の得点加算、揃った行があれば消去アニメーションを開始
+    def lock_piece(self):
+        self.score += LOCK_SCORE
+        self.pieces += 1
+        rows, points = clear_lines(self.grid)
+        self.fall_time = 0
+        if not rows:
+            if self.pending_garbage:
+                self._add_garbage()
+            self.spawn_next()
+            return
+        self.score += points
+        self.lines += len(rows)
+        self.events.append(("lines", (rows, points)))
+        if self.animate_line_clears:
+            self.line_clear = LineClearAnimation(rows)
+            self.line_clear.update(self.grid, 0)
+        else:
+            self.grid = collapse_lines(self.grid, rows, self.tops)
+            self.spawn_next()
+
+    def _finish_line_clear(self):
+        self.grid = collapse_lines(self.grid, self.line_clear.rows, self.tops)
+        self.line_clear = None
+        for _ in range(self.pending_events):
+            self._random_event()
+        self.pending_events = 0
+        self.spawn_next()
+        self.fall_time = 0
+        changes = self.pending_changes
+        self.pending_changes = 0
+        for _ in range(changes):
+            self.change_mino()
+
+    def _random_event(self):
+        self.grid, name = trigger_random_event(self.grid, self.abnormal_states, self.tops, self.rng)
+        self.events.append(("random_event", name))
+
+    # 溜まったおじゃまブロックをせり上げる(穴の位置はゲームの乱数で決める)
+    def _add_garbage(self):
+        count = self.pending_garbage
+        self.pending_garbage = 0
+        add_garbage_rows(self.grid, [self.rng.randint(0, COLS - 1) for _ in range(count)], self.tops)
+        self.events.append(("garbage", count))
+
+    # 対戦相手からのおじゃまブロック(次にラインを消さずにミノを固定したときにせり上がる)
+    def receive_garbage(self, count=1):
+        if not self.game_over:
+            self.pending_garbage += count
+
+    # センサー検出時のランダムイベント(消去アニメーション中は行番号がずれないよう終了後に発生させる)
+    def trigger_event(self):
+        if self.game_over:
+            return
+        if self.line_clear:
+            self.pending_events += 1
+        else:
+            self._random_event()
+
+    # ミノチェンジ(消去アニメーション中は終了後に次のミノに対して行う)
+    def change_mino(self):
+        if self.change_count - self.pending_changes <= 0 or self.game_over:
+            return False
+        if self.line_clear:
+            self.pending_changes += 1
+            return True
+        self.current, self.next_mino = self.next_mino, self.new_piece()
+        self.change_count -= 1
+        self.events.append(("change", None))
+        return True
+
+    # 操作の適用(COMMAND CONFUSION時はシャッフル辞書に基づいて入れ替え)、動けたらTrue
+    def apply_action(self, action):
+        if action == "change":
+            return self.change_mino()
+        current = self.active_piece
+        if current is None:
+            return False
+        if self.abnormal_states["command_confusion"]:
+            action = self.abnormal_states["shuffled_commands"].get(action, action)
+
+        grid = self.grid
+        if action == "left":
+            if not check_collision(grid, current.cells, current.x - 1, current.y):
+                current.x -= 1
+                return True
+        elif action == "right":
+            if not check_collision(grid, current.cells, current.x + 1, current.y):
+                current.x += 1
+                return True
+        elif action == "down":
+            if not check_collision(grid, current.cells, current.x, current.y + 1):
+                current.y += 1
+                return True
+        elif action == "rotate":
+            rotation, rotated = current.rotated()
+            if not check_collision(grid, rotated.cells, current.x, current.y):
+                current.rotation = rotation
+                return True
+        elif action == "drop":
+            hard_drop(grid, current, self.tops)
+            self.lock_piece()
+            return True
+        return False
+
+    # 時間経過(ms)、落下と消去アニメーションを進める
+    def step(self, dt):
+        if self.game_over:
+            return
+        self.ticks += 1
+        if self.line_clear:
+            if self.line_clear.update(self.grid, dt):
+                self._finish_line_clear()
+            return
+        self.fall_time += dt
+        if self.fall_time > self.current_fall_speed():
+            current = self.current
+            if not check_collision(self.grid, current.cells, current.x, current.y + 1):
+                current.y += 1
+            else:
+                merge(self.grid, current.cells, current.x, current.y, current.color, self.tops)
+                self.lock_piece()
+            self.fall_time = 0
@@ -0,0 +1,189 @@
+# 学習用の環境(Gymnasiumと同じreset/stepの形、numpyが必要)
+# ルールはengine.Gameそのもので、センサーによるランダムイベント(REVERSE、COMMAND CONFUSION、SPEED UPなど)も起こる
+#   env = TetrisEnv(seed=0)
+#   obs, info = env.reset()
+#   obs, reward, terminated, truncated, info = env.step(action)
+# VecTetrisEnvはN個のゲームを1回の呼び出しで進め、観測・報酬を(N, ...)の配列で返す
+# (ゲームはPythonのループで1つずつ進めるので速さはTetrisEnvとほぼ同じ、観測を共有の配列に書き込んでまとめるだけ)
+#
+# 行動: ACTIONSの番号("noop"は何もしない、COMMAND CONFUSION中は入れ替え後の操作になる)
+# 観測: 辞書
+#   board:  (ROWS, COLS) uint8 固定済みのブロックがあれば1(操作中のミノは含まない)
+#   piece:  (4,) int16 操作中のミノの種類・回転・x・y(消去アニメーション中やゲームオーバー後は-1)
+#   next:   (1 + LOOKAHEAD,) int8 next_minoとその後に出るミノの種類
+#   status: (4,) uint8 REVERSE・COMMAND CONFUSION・SPEED UP・残りのミノチェンジ回数
+# 報酬: 得点の増分
+# 1回のstepで操作を1つ与えてからframe_ms(ms)時間を進める
+import random
+
+import numpy as np
+
+from engine import COLS, LOOKAHEAD, ROWS, Game
+from simulate import EVENT_INTERVAL, SIM_STEP
+
+ACTIONS = ["noop", "left", "right", "down", "rotate", "drop", "change"]
+FRAME_MS = 50  # 1回のstepで進める時間(ms)
+
+
+def _observation_buffers(count):
+    return {
+        "board": np.zeros((count, ROWS, COLS), dtype=np.uint8),
+        "piece": np.zeros((count, 4), dtype=np.int16),
+        "next": np.zeros((count, 1 + LOOKAHEAD), dtype=np.int8),
+        "status": np.zeros((count, 4), dtype=np.uint8),
+    }
+
+
+class TetrisEnv:
+    # event_interval: センサーが反応する平均間隔(ms、0なら反応しない)
+    # max_steps: これだけstepしたら打ち切る(truncated)
+    # buffers/index: VecTetrisEnvが観測の書き込み先を渡すときに使う
+    def __init__(self, seed=None, randomizer="uniform", frame_ms=FRAME_MS, event_interval=EVENT_INTERVAL,
+                 max_steps=None, buffers=None, index=0):
+        self.randomizer = randomizer
+        self.frame_ms = frame_ms
+        self.event_chance = SIM_STEP / event_interval if event_interval else 0
+        self.max_steps = max_steps
+        self.buffers = buffers if buffers is not None else _observation_buffers(1)
+        self.index = index
+        self.seeds = random.Random(seed)  # エピソードごとの種
+        self.game = None
+        self.steps = 0
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seeds = random.Random(seed)
+        episode_seed = self.seeds.getrandbits(32)
+        self.game = Game(False, episode_seed, self.randomizer)
+        self.sensor = random.Random(episode_seed ^ 0x5EED)
+        self.steps = 0
+        self._write_board()
+        self._write_piece()
+        return self.observation(), {"seed": episode_seed}
+
+    # 観測(書き込み先の自分の行のコピー、次のstepで書き換わらない)
+    def observation(self):
+        i = self.index
+        return {name: buffer[i].copy() for name, buffer in self.buffers.items()}
+
+    def _write_board(self):
+        board = self.buffers["board"][self.index]
+        board[:] = [[1 if cell else 0 for cell in row] for row in self.game.grid]
+
+    # 盤面以外の観測(毎step更新する)
+    def _write_piece(self):
+        game = self.game
+        i = self.index
+        current = game.active_piece
+        if current is None:
+            self.buffers["piece"][i] = -1
+        else:
+            self.buffers["piece"][i] = (current.kind, current.rotation, current.x, current.y)
+        upcoming = game.upcoming(LOOKAHEAD)
+        self.buffers["next"][i] = [game.next_mino.kind] + upcoming + [-1] * (LOOKAHEAD - len(upcoming))
+        states = game.abnormal_states
+        self.buffers["status"][i] = (states["reverse"], states["command_confusion"], states["speed_up"],
+                                     game.change_count)
+
+    # (報酬, 終了, 打ち切り, 消えた行数)を返し、観測は書き込み先に反映する
+    def _advance(self, action):
+        game = self.game
+        score = game.score
+        pieces = game.pieces
+        name = ACTIONS[action]
+        if name == "change":
+            game.change_mino()
+        elif name != "noop":
+            game.apply_action(name)
+        sensor = self.sensor
+        chance = self.event_chance
+        for _ in range(max(1, self.frame_ms // SIM_STEP)):
+            if game.game_over:
+                break
+            game.step(SIM_STEP)
+            if chance and sensor.random() < chance:
+                game.trigger_event()
+        board_changed = game.pieces != pieces
+        lines = 0
+        for kind, value in game.drain_events():
+            if kind == "random_event":
+                board_changed = True
+            elif kind == "lines":
+                lines += len(value[0])
+        if board_changed:
+            self._write_board()
+        self._write_piece()
+        self.steps += 1
+        truncated = self.max_steps is not None and self.steps >= self.max_steps
+        return game.score - score, game.game_over, truncated and not game.game_over, lines
+
+    def step(self, action):
+        reward, terminated, truncated, lines = self._advance(action)
+        info = {"score": self.game.score, "lines": lines}
+        return self.observation(), reward, terminated, truncated, info
+
+
+# N個のゲームをまとめて進める
+# 終わったゲームはその場でresetし、返す観測は新しいゲームの最初の観測になる
+# 終わったときの観測と情報はinfoの"final_observation"/"final_info"(終わったゲームの番号以外はNone)に入れ、
+# "_final_observation"/"_final_info"はどのゲームが終わったかの真偽値の配列(Gymnasiumのベクトル環境と同じ)
+# copy=Falseなら観測・報酬などは共有の配列をそのまま返すので、次のreset/stepで上書きされる
+class VecTetrisEnv:
+    def __init__(self, count, seed=None, copy=True, **options):
+        self.count = count
+        self.copy = copy
+        self.buffers = _observation_buffers(count)
+        seeds = random.Random(seed)
+        self.envs = [TetrisEnv(seeds.getrandbits(32), buffers=self.buffers, index=i, **options)
+                     for i in range(count)]
+        self.rewards = np.zeros(count, dtype=np.int32)
+        self.terminated = np.zeros(count, dtype=bool)
+        self.truncated = np.zeros(count, dtype=bool)
+        self.scores = np.zeros(count, dtype=np.int32)
+        self.lines = np.zeros(count, dtype=np.int16)
+
+    def reset(self, seed=None):
+        seeds = random.Random(seed) if seed is not None else None
+        for env in self.envs:
+            env.reset(seeds.getrandbits(32) if seeds else None)
+        self.scores[:] = 0
+        return self._observations(), {}
+
+    def _observations(self):
+        if not self.copy:
+            return self.buffers
+        return {name: buffer.copy() for name, buffer in self.buffers.items()}
+
+    # actionsは長さNの整数の列
+    def step(self, actions):
+        rewards = self.rewards
+        terminated = self.terminated
+        truncated = self.truncated
+        scores = self.scores
+        lines = self.lines
+        final_observations = None
+        for i, (env, action) in enumerate(zip(self.envs, actions.tolist() if hasattr(actions, "tolist") else actions)):
+            reward, done, cut, cleared = env._advance(action)
+            rewards[i] = reward
+            terminated[i] = done
+            truncated[i] = cut
+            lines[i] = cleared
+            scores[i] = env.game.score
+            if done or cut:
+                if final_observations is None:
+                    final_observations = np.full(self.count, None, dtype=object)
+                    final_infos = np.full(self.count, None, dtype=object)
+                final_observations[i] = env.observation()
+                final_infos[i] = {"score": env.game.score, "lines": cleared}
+                env.reset()
+        info = {"score": scores, "lines": lines}
+        if self.copy:
+            rewards, terminated, truncated = rewards.copy(), terminated.copy(), truncated.copy()
+            info = {"score": scores.copy(), "lines": lines.copy()}
+        if final_observations is not None:
+            finished = terminated | truncated
+            info["final_observation"] = final_observations
+            info["_final_observation"] = finished
+            info["final_info"] = final_infos
+            info["_final_info"] = finished.copy()
+        return self._observations(), rewards, terminated, truncated, info
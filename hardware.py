@@ -0,0 +1,250 @@
+# 入出力バックエンド(タクトスイッチ、モーションセンサー、I2Cキャラクタ表示液晶)
+# 実機用のモジュールは実機バックエンドを選んだときだけ読み込む
+#   gpio:     実機(gpiozero / RPi.GPIO / LCD1602)
+#   keyboard: キーボードで代用(Cキー: ミノチェンジ、Eキー: センサー)、液晶の内容はウィンドウタイトルに表示
+#   sim:      台本どおりに入力を発生させ、液晶への書き込みを記録する(テスト用)
+# ボタンとセンサーは立ち上がりを"button"/"pir"イベントとしてキューに積み、メインループがpoll_events()でまとめて取り出す
+# キューに積んでから取り出されるまでの時間(ms)はlatenciesに残す
+# lcd_writeはLcdWriterのスレッドから呼ばれる、画面への反映が要るものはメインループが毎フレーム呼ぶpresent()で行う
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+BUTTON_PIN = 25
+PIR_PIN = 17
+LCD_ADDRESS = 0x3f
+LCD_COLS = 16
+BUTTON_BOUNCE_TIME = 0.05  # タクトスイッチのチャタリング除去時間(秒)
+PIR_BOUNCE_TIME = 200      # センサーの立ち上がり検出の最小間隔(ms)
+LATENCY_SAMPLES = 100      # 遅延を保持する件数
+
+
+# 割り込みから積まれた(イベント, 積んだ時刻)を取り出す(空なら何もしない)
+def drain_queue(events, latencies):
+    drained = []
+    now = time.monotonic()
+    while not events.empty():
+        try:
+            device, queued = events.get_nowait()
+        except queue.Empty:
+            break
+        drained.append(device)
+        latencies.append((now - queued) * 1000)
+    return drained
+
+
+# 実機(ボタンはgpiozeroのwhen_activated、センサーはRPi.GPIOのエッジ検出で割り込みを受ける)
+class GpioBackend:
+    name = "gpio"
+
+    def __init__(self, button_pin=BUTTON_PIN, pir_pin=PIR_PIN, lcd_address=LCD_ADDRESS,
+                 button_bounce_time=BUTTON_BOUNCE_TIME, pir_bounce_time=PIR_BOUNCE_TIME):
+        import gpiozero
+        try:
+            import RPi.GPIO as GPIO
+        except RuntimeError as e:
+            # Raspberry Pi以外では読み込んだ時点でRuntimeErrorになる
+            raise ImportError(str(e)) from e
+        import LCD1602
+        self.GPIO = GPIO
+        self.LCD1602 = LCD1602
+        self.pir_pin = pir_pin
+        self.lcd_address = lcd_address
+        self.events = queue.SimpleQueue()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.btn = gpiozero.DigitalInputDevice(pin=button_pin, pull_up=False, bounce_time=button_bounce_time)
+        self.btn.when_activated = lambda: self.events.put(("button", time.monotonic()))
+        try:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(pir_pin, GPIO.IN)
+            GPIO.add_event_detect(pir_pin, GPIO.RISING,
+                                  callback=lambda channel: self.events.put(("pir", time.monotonic())),
+                                  bouncetime=pir_bounce_time)
+        except Exception:
+            # 途中まで開いたものを閉じてから失敗を伝える(ボタンとセンサーが効かないまま起動しない)
+            self.btn.close()
+            GPIO.cleanup()
+            raise
+
+    def poll_events(self):
+        return drain_queue(self.events, self.latencies)
+
+    def lcd_init(self):
+        self.LCD1602.init(self.lcd_address, 1)
+
+    def lcd_write(self, x, y, text):
+        self.LCD1602.write(x, y, text)
+
+    def present(self):
+        pass
+
+    def close(self):
+        self.GPIO.remove_event_detect(self.pir_pin)
+        self.btn.close()
+        self.GPIO.cleanup()
+
+
+# キーボードで代用
+class KeyboardBackend:
+    name = "keyboard"
+
+    def __init__(self, button_key=None, pir_key=None):
+        import pygame
+        self.pygame = pygame
+        self.button_key = pygame.K_c if button_key is None else button_key
+        self.pir_key = pygame.K_e if pir_key is None else pir_key
+        self.held = {"button": False, "pir": False}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # 押した瞬間に読むので常に空
+        self.lcd_lines = ["", ""]
+        self.caption = None  # ウィンドウタイトルに反映した内容
+
+    # キーが押された瞬間だけイベントにする
+    def poll_events(self):
+        if not self.pygame.display.get_init():
+            return []
+        pressed = self.pygame.key.get_pressed()
+        events = []
+        for device, key in (("button", self.button_key), ("pir", self.pir_key)):
+            down = bool(pressed[key])
+            if down and not self.held[device]:
+                events.append(device)
+            self.held[device] = down
+        return events
+
+    def lcd_init(self):
+        self.lcd_lines = ["", ""]
+
+    # LcdWriterのスレッドからは内容を覚えるだけ(SDLのウィンドウはメインスレッドからしか触れない)
+    def lcd_write(self, x, y, text):
+        line = self.lcd_lines[y].ljust(x)
+        self.lcd_lines[y] = (line[:x] + text + line[x + len(text):])[:LCD_COLS]
+
+    # 液晶の内容をウィンドウタイトルに表示(メインループから呼ぶ)
+    def present(self):
+        caption = " | ".join(["TETRIS"] + [l.strip() for l in self.lcd_lines if l.strip()])
+        if caption != self.caption and self.pygame.display.get_surface() is not None:
+            self.pygame.display.set_caption(caption)
+            self.caption = caption
+
+    def close(self):
+        pass
+
+
+# 台本どおりに動く代用品
+# scriptは(開始からの時間ms, "button"または"pir", 値)のリストで、0から1への変化がイベントになる
+# press_button()/trigger_pir()は別スレッドからも呼べる
+class SimulatedBackend:
+    name = "sim"
+
+    def __init__(self, script=(), clock=None):
+        self.script = sorted(script, key=lambda item: item[0])
+        self.clock = clock or (lambda: time.monotonic() * 1000)
+        self.start = self.clock()
+        self.position = 0
+        self.values = {"button": 0, "pir": 0}
+        self.events = queue.SimpleQueue()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.lcd_lines = ["", ""]
+        self.lcd_writes = []
+
+    def press_button(self):
+        self.events.put(("button", time.monotonic()))
+
+    def trigger_pir(self):
+        self.events.put(("pir", time.monotonic()))
+
+    def _advance(self):
+        now = self.clock() - self.start
+        while self.position < len(self.script) and self.script[self.position][0] <= now:
+            _, device, value = self.script[self.position]
+            if value and not self.values[device]:
+                self.events.put((device, time.monotonic()))
+            self.values[device] = value
+            self.position += 1
+
+    def poll_events(self):
+        self._advance()
+        return drain_queue(self.events, self.latencies)
+
+    def lcd_init(self):
+        self.lcd_lines = ["", ""]
+
+    def lcd_write(self, x, y, text):
+        self.lcd_writes.append((x, y, text))
+        line = self.lcd_lines[y].ljust(x)
+        self.lcd_lines[y] = (line[:x] + text + line[x + len(text):])[:LCD_COLS]
+
+    def present(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# 液晶への書き込みを別スレッドで行う
+# 行ごとに最新の内容だけを保持するので、I2Cが遅くても溜まらず描画ループも待たされない
+# 依頼から書き込み完了までの時間(ms)はlatenciesに残す
+class LcdWriter:
+    def __init__(self, backend, rows=2):
+        self.backend = backend
+        self.pending = {}               # 行 -> (まだ書き込んでいない最新の内容, 依頼時刻)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.written = [None] * rows    # 行ごとに最後に書き込んだ内容
+        self.requested = [None] * rows  # 行ごとに最後に依頼された内容
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="lcd-writer", daemon=True)
+        self.thread.start()
+
+    # 書き込みの依頼(すぐに戻る)
+    def write(self, row, text):
+        if self.requested[row] == text:
+            return
+        with self.condition:
+            self.requested[row] = text
+            self.pending[row] = (text, time.monotonic())
+            self.condition.notify()
+
+    def _run(self):
+        self.backend.lcd_init()
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.pending and not self.running:
+                    return
+                pending = self.pending
+                self.pending = {}
+            for row, (text, requested) in sorted(pending.items()):
+                if self.written[row] != text:
+                    self.backend.lcd_write(0, row, text)
+                    self.written[row] = text
+                    self.latencies.append((time.monotonic() - requested) * 1000)
+
+    # 残っている内容を書き込んでから終了
+    def close(self, timeout=1.0):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout)
+
+
+BACKENDS = {
+    "gpio": GpioBackend,
+    "keyboard": KeyboardBackend,
+    "sim": SimulatedBackend,
+}
+
+
+# バックエンドの選択(未指定なら環境変数TETRIS_BACKEND、autoなら実機用のモジュールがなければキーボード)
+# モジュールはあるのに初期化に失敗したとき(エッジ検出が使えないなど)はそのまま例外にする
+def create_backend(name=None):
+    name = name or os.environ.get("TETRIS_BACKEND", "auto")
+    if name != "auto":
+        return BACKENDS[name]()
+    try:
+        return GpioBackend()
+    except ImportError:
+        return KeyboardBackend()
@@ -0,0 +1,162 @@
+# NumPy版の盤面(numpyがある環境でだけ使う、policies.pyなどからは必要になったときに読み込む)
+# グリッドを色番号(bitboard.PALETTEの番号、0は空き)のuint8配列で持ち、BitBoardと同じ操作ができる
+# 1手ずつの操作はBitBoardより遅いが、置き場所の候補をまとめて(N, 行, 列)の配列にして一度に評価できる
+import numpy as np
+
+from bitboard import COLS, ROWS, PALETTE, color_index
+
+
+# PieceMasksをブロックの有無の配列(bottom行 x 幅)に変換したもの
+_piece_arrays = {}
+
+def piece_array(piece):
+    key = piece.masks
+    array = _piece_arrays.get(key)
+    if array is None:
+        width = piece.right
+        array = np.array([[(mask >> j) & 1 for j in range(width)] for mask in piece.masks], dtype=bool)
+        _piece_arrays[key] = array
+    return array
+
+
+# 列ごとの最上段のブロックの行(空の列はrows)、cellsは(行, 列)または(N, 行, 列)
+def column_tops(cells):
+    occupied = cells != 0
+    rows = cells.shape[-2]
+    return np.where(occupied.any(axis=-2), occupied.argmax(axis=-2), rows)
+
+
+class NumpyBoard:
+    def __init__(self, cols=COLS, rows=ROWS):
+        self.cols = cols
+        self.rows = rows
+        self.cells = np.zeros((rows, cols), dtype=np.uint8)
+        self.tops = [rows] * cols
+
+    @classmethod
+    def from_grid(cls, grid):
+        board = cls(len(grid[0]), len(grid))
+        board.cells[:] = [[color_index(color) if color else 0 for color in row] for row in grid]
+        board.tops = board.column_tops()
+        return board
+
+    @classmethod
+    def from_cells(cls, cells):
+        board = cls.__new__(cls)
+        board.rows, board.cols = cells.shape
+        board.cells = cells
+        board.tops = board.column_tops()
+        return board
+
+    def to_grid(self):
+        return [[PALETTE[c] for c in row] for row in self.cells.tolist()]
+
+    def copy(self):
+        board = NumpyBoard.__new__(NumpyBoard)
+        board.cols = self.cols
+        board.rows = self.rows
+        board.cells = self.cells.copy()
+        board.tops = self.tops[:]
+        return board
+
+    # 盤面の占有状態を表すハッシュ可能な値(色は含まない)
+    def key(self):
+        return np.packbits(self.cells != 0).tobytes()
+
+    def column_tops(self):
+        return column_tops(self.cells).tolist()
+
+    # 着地位置の行(BitBoard.drop_yと同じ考え方)
+    def drop_y(self, piece, x, y):
+        tops = self.tops
+        landing = self.rows
+        for j, bottom in piece.bottoms:
+            top = tops[x + j]
+            if top <= y + bottom:
+                while not self.collides(piece, x, y + 1):
+                    y += 1
+                return y
+            landing = min(landing, top - bottom - 1)
+        return landing
+
+    # 衝突判定(pieceはbitboard.encode_shapeの結果)
+    def collides(self, piece, x, y):
+        if x + piece.left < 0 or x + piece.right > self.cols or y + piece.bottom > self.rows:
+            return True
+        array = piece_array(piece)
+        top = max(y, 0)
+        region = self.cells[top:y + piece.bottom, x:x + piece.right]
+        return bool((region != 0)[array[top - y:]].any())
+
+    def merge(self, piece, x, y, color):
+        array = piece_array(piece)
+        top = max(y, 0)
+        array = array[top - y:]
+        region = self.cells[top:y + piece.bottom, x:x + piece.right]
+        region[array] = color_index(color)
+        tops = self.tops
+        for j in range(array.shape[1]):
+            filled = np.flatnonzero(array[:, j])
+            if len(filled) and top + filled[0] < tops[x + j]:
+                tops[x + j] = top + int(filled[0])
+
+    def full_rows(self):
+        return np.flatnonzero(self.cells.all(axis=1)).tolist()
+
+    # 揃った行以外を下に詰めて写す
+    def clear_rows(self, rows):
+        if not rows:
+            return 0
+        keep = np.ones(self.rows, dtype=bool)
+        keep[rows] = False
+        cells = np.zeros_like(self.cells)
+        cells[len(rows):] = self.cells[keep]
+        self.cells = cells
+        self.tops = self.column_tops()
+        return len(rows)
+
+    def add_garbage_row(self, hole, color):
+        row = np.full(self.cols, color_index(color), dtype=np.uint8)
+        row[hole] = 0
+        self.cells = np.vstack([self.cells[1:], row])
+        self.tops = self.column_tops()
+
+
+# 盤面の束(N, 行, 列)の揃った行を消して下に詰め、消えた行数を返す
+def clear_full_rows(batch):
+    full = batch.all(axis=2)
+    lines = full.sum(axis=1)
+    for i in np.flatnonzero(lines):
+        cells = np.zeros_like(batch[i])
+        cells[lines[i]:] = batch[i][~full[i]]
+        batch[i] = cells
+    return lines
+
+
+# 盤面の束の特徴量(積み上がりの高さの合計、穴の数、凸凹)
+def features(batch):
+    occupied = batch != 0
+    rows = batch.shape[1]
+    heights = rows - column_tops(batch)
+    covered = np.logical_or.accumulate(occupied, axis=1)
+    holes = (covered & ~occupied).sum(axis=(1, 2))
+    bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+    return heights.sum(axis=1), holes, bumpiness
+
+
+# 置き場所の候補(policies.placementsの結果)をまとめて置いて評価する
+def evaluate_placements(board, piece, candidates, weights):
+    if not candidates:
+        return []
+    batch = np.repeat(board.cells[None], len(candidates), axis=0)
+    index = color_index(piece.color)
+    for n, (_, shift, y, state) in enumerate(candidates):
+        array = piece_array(state.masks)
+        x = piece.x + shift
+        top = max(y, 0)
+        batch[n, top:y + array.shape[0], x:x + array.shape[1]][array[top - y:]] = index
+    lines = clear_full_rows(batch)
+    height, holes, bumpiness = features(batch)
+    values = (weights["height"] * height + weights["lines"] * lines
+              + weights["holes"] * holes + weights["bumpiness"] * bumpiness)
+    return values.tolist()
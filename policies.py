@@ -0,0 +1,176 @@
+# 自動で遊ぶための方針(シミュレーション用)
+# next_action(game)が次に入力する操作名を返す(Noneなら何もしない)
+#   random:   ランダムに操作する
+#   greedy:   ミノが出るたびに置ける場所をすべて調べ、盤面評価が最も良い場所へ動かす
+#   scripted: 決められた操作を順に繰り返す
+# COMMAND CONFUSION中は入れ替え後に狙った操作になるようにキーを選ぶ(画面の"???"を覚えたプレイヤー相当)
+# greedyの盤面は"bitboard"(BitBoard)か"numpy"(numpyboard.NumpyBoard、候補をまとめて評価する)
+# greedyでtucks=Trueならreachable.pyでせり出しの下に入り込む置き方まで調べる
+from bitboard import BitBoard
+from engine import ACTIONS, ROTATIONS
+
+
+# 盤面評価の重み(積み上がりの高さ、消した行数、穴、凸凹)
+DEFAULT_WEIGHTS = {"height": -0.51, "lines": 0.76, "holes": -0.36, "bumpiness": -0.18}
+
+
+# 入れ替え後にactionになるキー
+def key_for(game, action):
+    shuffled = game.abnormal_states["shuffled_commands"]
+    if game.abnormal_states["command_confusion"] and shuffled:
+        for key, mapped in shuffled.items():
+            if mapped == action:
+                return key
+    return action
+
+
+# 盤面の評価値(大きいほど良い)
+def evaluate(board, lines, weights=DEFAULT_WEIGHTS):
+    heights = [board.rows - top for top in board.tops]
+    holes = 0
+    covered = 0
+    for bits in board.bits:
+        holes += bin(covered & ~bits).count("1")
+        covered |= bits
+    bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+    return (weights["height"] * sum(heights) + weights["lines"] * lines
+            + weights["holes"] * holes + weights["bumpiness"] * bumpiness)
+
+
+# 今の位置から回転してから左右に動かして落とせる場所
+# (回転回数, 左右の移動量, 着地した行, 回転状態)のリスト、同じ形になる回転はまとめる
+def placements(board, piece):
+    results = []
+    states = ROTATIONS[piece.kind]
+    x0, y = piece.x, piece.y
+    seen = set()
+    for turns in range(4):
+        state = states[(piece.rotation + turns) % 4]
+        masks = state.masks
+        if board.collides(masks, x0, y):
+            break
+        if state.shape in seen:
+            continue
+        seen.add(state.shape)
+        for direction, x in ((-1, x0), (1, x0 + 1)):
+            while not board.collides(masks, x, y):
+                results.append((turns, x - x0, board.drop_y(masks, x, y), state))
+                x += direction
+    return results
+
+
+# 置いた後の盤面と消えた行数
+def place(board, state, x, y, color):
+    board = board.copy()
+    board.merge(state.masks, x, y, color)
+    rows = board.full_rows()
+    board.clear_rows(rows)
+    return board, len(rows)
+
+
+# 置き場所の候補をそれぞれ置いて評価した値のリスト
+def evaluate_placements(board, piece, candidates, weights=DEFAULT_WEIGHTS):
+    return [evaluate(*place(board, state, piece.x + shift, y, piece.color), weights)
+            for _, shift, y, state in candidates]
+
+
+# 盤面の種類 -> (盤面のクラス, evaluate_placements)
+def board_backend(name):
+    if name == "numpy":
+        import numpyboard
+        return numpyboard.NumpyBoard, numpyboard.evaluate_placements
+    if name != "bitboard":
+        raise ValueError(f"unknown board: {name}")
+    return BitBoard, evaluate_placements
+
+
+# 置き場所を操作の列にする
+def plan_actions(turns, shift):
+    return ["rotate"] * turns + ["left" if shift < 0 else "right"] * abs(shift) + ["drop"]
+
+
+class RandomPolicy:
+    def __init__(self, rng, drop_chance=0.1):
+        self.rng = rng
+        self.drop_chance = drop_chance
+
+    def next_action(self, game):
+        if self.rng.random() < self.drop_chance:
+            return "drop"
+        return self.rng.choice(ACTIONS[:4])
+
+
+class ScriptedPolicy:
+    def __init__(self, actions):
+        self.actions = list(actions)
+        self.position = 0
+
+    def next_action(self, game):
+        action = self.actions[self.position % len(self.actions)]
+        self.position += 1
+        return action
+
+
+class GreedyPolicy:
+    def __init__(self, weights=None, board="bitboard", tucks=False):
+        self.weights = weights or DEFAULT_WEIGHTS
+        self.board_class, self.evaluate_placements = board_backend(board)
+        self.tucks = tucks
+        self.piece = None
+        self.plan = []
+
+    # 今のミノで最も評価の良い置き方の操作列
+    def choose(self, game):
+        piece = game.current
+        board = self.board_class.from_grid(game.grid)
+        if self.tucks:
+            return self.choose_reachable(board, piece)
+        candidates = placements(board, piece)
+        if not candidates:
+            return ["drop"]
+        values = self.evaluate_placements(board, piece, candidates, self.weights)
+        best = max(range(len(candidates)), key=values.__getitem__)
+        turns, shift, _, _ = candidates[best]
+        return plan_actions(turns, shift)
+
+    # せり出しの下も含めて届く場所から選ぶ(操作列はreachable.pyが求めたもの)
+    def choose_reachable(self, board, piece):
+        from reachable import reachable_placements
+        found = reachable_placements(board, piece)
+        if not found:
+            return ["drop"]
+        candidates = [(0, p.x - piece.x, p.y, p.state) for p in found]
+        values = self.evaluate_placements(board, piece, candidates, self.weights)
+        best = max(range(len(found)), key=values.__getitem__)
+        return list(found[best].actions)
+
+    def next_action(self, game):
+        if game.active_piece is None:
+            return None
+        if game.current is not self.piece:
+            self.piece = game.current
+            self.plan = self.choose(game)
+        if not self.plan:
+            return None
+        return key_for(game, self.plan.pop(0))
+
+
+# 先読み付きのコンピュータプレイヤー(ai.py)
+def _auto_player(**options):
+    from ai import AutoPlayer
+    return AutoPlayer(**options)
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "greedy": GreedyPolicy,
+    "scripted": ScriptedPolicy,
+    "ai": _auto_player,
+}
+
+
+# 名前から方針を生成(randomはrng、scriptedはactionsが必要)
+def make_policy(name, rng=None, **options):
+    if name == "random":
+        return RandomPolicy(rng, **options)
+    return POLICIES[name](**options)
@@ -0,0 +1,146 @@
+# 処理区間ごとの時間計測(有効にしたときだけ動く)
+# メインループの各処理をsection()で囲み、エンジンの関数はinstrument()で包んで時間を数える
+# 区間は入れ子になり、呼び出し経路(スタック)ごとに回数・合計時間・自分だけの時間を集計する
+# 結果は2つの形式で書き出せる
+#   .folded: flamegraph.pl / speedscope用のスタック形式("frame;play;draw 1234"、値はマイクロ秒)
+#   .prof:   cProfile互換(pstats.Stats(path)やsnakevizで読める)
+import marshal
+import sys
+import time
+from collections import defaultdict
+
+
+class _Section:
+    __slots__ = ("profiler", "name")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.begin(self.name)
+
+    def __exit__(self, *exc):
+        self.profiler.end()
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.stack = []  # [区間名, 開始時刻, 子区間の時間の合計]
+        self.records = defaultdict(lambda: [0, 0.0, 0.0])  # スタック -> [回数, 合計時間, 自分だけの時間]
+        self.context = ()
+        self.wrapped = []
+
+    def begin(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def end(self):
+        name, start, child = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        path = self.context + tuple(frame[0] for frame in self.stack) + (name,)
+        record = self.records[path]
+        record[0] += 1
+        record[1] += elapsed
+        record[2] += elapsed - child
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def section(self, name):
+        return _Section(self, name)
+
+    # 以降の区間の先頭に付ける名前(画面の状態や状態異常ごとに分けて集計する)
+    def set_context(self, *names):
+        self.context = names
+
+    # module.nameの関数を計測付きの関数に置き換える(restore()で戻す)
+    def instrument(self, module, name):
+        func = getattr(module, name)
+        begin = self.begin
+        end = self.end
+
+        def wrapper(*args, **kwargs):
+            begin(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end()
+        wrapper.__wrapped__ = func
+        setattr(module, name, wrapper)
+        self.wrapped.append((module, name, func))
+
+    def restore(self):
+        for module, name, func in reversed(self.wrapped):
+            setattr(module, name, func)
+        self.wrapped = []
+
+    def write_folded(self, f):
+        for path, (_, _, own) in sorted(self.records.items()):
+            if own > 0:
+                f.write(f"{';'.join(path)} {round(own * 1e6)}\n")
+
+    # pstatsの形式: {(ファイル, 行, 関数名): (呼び出し回数, 回数, 自分だけの時間, 合計時間, {呼び出し元: (...)})}
+    # 区間はファイル名"~"、関数名を区間名として扱い、同じ区間名は呼び出し経路によらずまとめる
+    def pstats_dict(self):
+        stats = {}
+        for path, (calls, total, own) in self.records.items():
+            key = ("~", 0, path[-1])
+            cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+            stats[key] = (cc + calls, nc + calls, tt + own, ct + total, callers)
+            if len(path) > 1:
+                caller = ("~", 0, path[-2])
+                ccc, cnc, ctt, cct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (ccc + calls, cnc + calls, ctt + own, cct + total)
+        return stats
+
+    def write_pstats(self, f):
+        marshal.dump(self.pstats_dict(), f)
+
+    # 拡張子が.profならcProfile互換、それ以外はスタック形式で保存
+    def save(self, path):
+        if path.endswith(".prof"):
+            with open(path, "wb") as f:
+                self.write_pstats(f)
+        else:
+            with open(path, "w") as f:
+                self.write_folded(f)
+
+    # 自分だけの時間が長い順の一覧
+    def summary(self, limit=20, file=sys.stderr):
+        rows = sorted(self.records.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        print(f"{'own ms':>10}{'total ms':>10}{'calls':>8}  stack", file=file)
+        for path, (calls, total, own) in rows:
+            print(f"{own * 1000:10.1f}{total * 1000:10.1f}{calls:8d}  {';'.join(path)}", file=file)
+
+
+# 無効時に使う何もしない計測
+class _NullSection:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullProfiler:
+    _section = _NullSection()
+
+    def begin(self, name):
+        pass
+
+    def end(self):
+        pass
+
+    def section(self, name):
+        return self._section
+
+    def set_context(self, *names):
+        pass
+
+    def instrument(self, module, name):
+        pass
+
+    def restore(self):
+        pass
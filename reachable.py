@@ -0,0 +1,112 @@
+# ミノが出現位置から最終的に置ける場所の列挙(AI・ヒント・解析用)
+# (回転, x, y)の状態を左右移動・ソフトドロップ・回転で幅優先に調べるので、せり出しの下に入り込む置き方も見つかる
+# 回転が違っても埋まるマスが同じ置き方(OやIなどの対称形)は1つにまとめ、最短の操作列を残す
+# 結果は(盤面の占有状態, ミノの種類・回転・位置)ごとにキャッシュするので同じ盤面への問い合わせは再計算しない
+# boardはbitboard.BitBoardかnumpyboard.NumpyBoard
+from collections import OrderedDict, deque
+
+from engine import ROTATIONS
+
+CACHE_SIZE = 4096  # キャッシュする問い合わせの数
+MOVES = (("left", -1, 0), ("right", 1, 0), ("down", 0, 1))
+
+
+# 置き場所1つ分
+# rotation, x, y: 置いたときの回転とミノの位置、state: engine.Rotation
+# cells: 埋まるマス(行, 列)の集合、actions: 出現位置からの操作列(最後のハードドロップを含む)
+# 回転と左右移動とハードドロップだけで届く置き場所はその操作列、届かなければ幅優先探索の最短の操作列
+class Placement:
+    __slots__ = ("rotation", "x", "y", "state", "cells", "actions")
+
+    def __init__(self, rotation, x, y, state, cells, actions):
+        self.rotation = rotation
+        self.x = x
+        self.y = y
+        self.state = state
+        self.cells = cells
+        self.actions = actions
+
+    def __repr__(self):
+        return f"Placement(rotation={self.rotation}, x={self.x}, y={self.y}, actions={self.actions})"
+
+
+_cache = OrderedDict()
+
+
+def _path(parents, node):
+    actions = []
+    while parents[node] is not None:
+        node, action = parents[node]
+        actions.append(action)
+    actions.reverse()
+    while actions and actions[-1] == "down":
+        actions.pop()  # 最後のハードドロップで届く
+    return actions
+
+
+# 出現位置で回転してから左右に動かしてハードドロップするだけで届くならその操作列
+def _direct_path(board, states, start, rotation, x, y):
+    rotation0, x0, y0 = start
+    turns = (rotation - rotation0) % 4
+    for n in range(1, turns + 1):
+        if board.collides(states[(rotation0 + n) % 4].masks, x0, y0):
+            return None
+    masks = states[rotation].masks
+    step = 1 if x > x0 else -1
+    for column in range(x0, x + step, step):
+        if board.collides(masks, column, y0):
+            return None
+    if board.drop_y(masks, x, y0) != y:
+        return None
+    return ["rotate"] * turns + ["left" if step < 0 else "right"] * abs(x - x0)
+
+
+# pieceの今の状態から置ける場所のリスト(pieceはengine.Tetrimino)
+def reachable_placements(board, piece):
+    start = (piece.rotation, piece.x, piece.y)
+    key = (board.key(), piece.kind, start)
+    placements = _cache.get(key)
+    if placements is not None:
+        _cache.move_to_end(key)
+        return placements
+
+    states = ROTATIONS[piece.kind]
+    collides = board.collides
+    placements = []
+    if not collides(states[start[0]].masks, start[1], start[2]):
+        parents = {start: None}
+        queue = deque([start])
+        seen_cells = set()
+        while queue:
+            node = queue.popleft()
+            rotation, x, y = node
+            masks = states[rotation].masks
+            for action, dx, dy in MOVES:
+                moved = (rotation, x + dx, y + dy)
+                if moved not in parents and not collides(masks, x + dx, y + dy):
+                    parents[moved] = (node, action)
+                    queue.append(moved)
+            turned = ((rotation + 1) % 4, x, y)
+            if turned not in parents and not collides(states[turned[0]].masks, x, y):
+                parents[turned] = (node, "rotate")
+                queue.append(turned)
+
+            # 下に動けなければ置ける場所
+            if collides(masks, x, y + 1):
+                state = states[rotation]
+                cells = frozenset((y + i, x + j) for i, j in state.cells)
+                if cells not in seen_cells:
+                    seen_cells.add(cells)
+                    actions = _direct_path(board, states, start, rotation, x, y)
+                    if actions is None:
+                        actions = _path(parents, node)
+                    placements.append(Placement(rotation, x, y, state, cells, actions + ["drop"]))
+
+    _cache[key] = placements
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return placements
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,216 @@
+# 入力のリプレイ(記録と再生)
+# 1セッション分の入力を小さなバイナリで記録し、TETRIS.pyで実時間再生するか、画面なしで最高速に再実行する
+#   python replay.py replays/xxx.trpl  # 画面なしで再実行して結果と速度を表示
+#
+# ファイル形式
+#   先頭: MAGIC + バージョン(1バイト)
+#   各記録: 可変長整数 (前の記録からの経過tick << 4) | 種類
+#     種類0〜7: 入力(INPUTSの順)
+#     START:    ゲーム開始、続けて乱数の種・出現方式・1tickの長さ(ms)をSTART_FORMATで格納(tickは0に戻る)
+#     END:      ゲーム終了(経過tickはゲーム終了時点まで)
+# tickはGame.step()の呼び出し回数なので、同じ種と同じtickに同じ入力を与えれば同じゲームになる
+import argparse
+import os
+import struct
+import time
+
+from engine import ACTIONS, Game, PieceGenerator
+
+MAGIC = b"TRPL"
+VERSION = 1
+# "change"はミノチェンジ(ボタン)、"pir"はセンサー、"garbage"は対戦相手からのおじゃまブロック1行
+INPUTS = ACTIONS + ["change", "pir", "garbage"]
+START = 14
+END = 15
+START_FORMAT = "<qBH"  # 乱数の種、出現方式(PieceGenerator.MODESの番号)、1tickの長さ(ms)
+START_SIZE = struct.calcsize(START_FORMAT)
+FLUSH_RECORDS = 32  # これだけ書いたらファイルに書き出す(異常終了しても直前までの入力が残るように)
+
+_input_codes = {name: code for code, name in enumerate(INPUTS)}
+
+
+def encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# 入力をゲームに与える
+def apply_input(game, name):
+    if name == "pir":
+        game.trigger_event()
+    elif name == "garbage":
+        game.receive_garbage()
+    else:
+        game.apply_action(name)
+
+
+# 記録されたゲーム1回分
+# inputsは(tick, 入力名)のリスト、end_tickは記録が終わった時点のtick(途中で終わったファイルならNone)
+class RecordedGame:
+    def __init__(self, seed, randomizer, step, inputs=None, end_tick=None):
+        self.seed = seed
+        self.randomizer = randomizer
+        self.step = step
+        self.inputs = inputs if inputs is not None else []
+        self.end_tick = end_tick
+
+    def new_game(self, animate_line_clears=True):
+        return Game(animate_line_clears, self.seed, self.randomizer)
+
+
+# 記録
+# ゲームを始めるたびにstart()、入力のたびにrecord()を呼ぶ
+# 書き込みはFLUSH_RECORDS件ごとにファイルに書き出し、flush()を毎フレーム呼べばそのフレームまでの入力も残る
+class ReplayWriter:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + bytes([VERSION]))
+        self.playing = False
+        self.last_tick = 0
+        self.unflushed = 0  # まだファイルに書き出していない記録の数
+
+    def _write(self, tick, code):
+        self.file.write(encode_varint((tick - self.last_tick) << 4 | code))
+        self.last_tick = tick
+        self.unflushed += 1
+        if self.unflushed >= FLUSH_RECORDS:
+            self.flush()
+
+    def flush(self):
+        if self.unflushed:
+            self.file.flush()
+            self.unflushed = 0
+
+    def start(self, game, step):
+        if self.playing:
+            self.end(self.last_tick)
+        self.last_tick = 0
+        self._write(0, START)
+        self.file.write(struct.pack(START_FORMAT, game.seed, PieceGenerator.MODES.index(game.randomizer), step))
+        self.playing = True
+
+    def record(self, tick, name):
+        if self.playing:
+            self._write(tick, _input_codes[name])
+
+    def end(self, tick):
+        if self.playing:
+            self._write(tick, END)
+            self.flush()
+            self.playing = False
+
+    def close(self):
+        self.end(self.last_tick)
+        self.file.close()
+
+
+# 途中で切れたファイル(異常終了や電源断)は最後の不完全な記録の手前までを読み、そのゲームはend_tick=Noneになる
+def loads(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a replay file")
+    version = data[len(MAGIC)]
+    if version != VERSION:
+        raise ValueError(f"unsupported replay version: {version}")
+    games = []
+    recorded = None
+    tick = 0
+    pos = len(MAGIC) + 1
+    while pos < len(data):
+        try:
+            value, pos = decode_varint(data, pos)
+        except IndexError:
+            break  # 可変長整数の途中で切れている
+        tick += value >> 4
+        code = value & 0xf
+        if code == START:
+            if pos + START_SIZE > len(data):
+                break  # 開始の情報の途中で切れている
+            seed, mode, step = struct.unpack_from(START_FORMAT, data, pos)
+            pos += START_SIZE
+            recorded = RecordedGame(seed, PieceGenerator.MODES[mode], step)
+            games.append(recorded)
+            tick = 0
+        elif recorded is None:
+            raise ValueError("replay record before game start")
+        elif code == END:
+            recorded.end_tick = tick
+            recorded = None
+        else:
+            recorded.inputs.append((tick, INPUTS[code]))
+    return games
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+# 記録どおりに入力を与える(実時間再生用)
+# step()の前にfeed()を呼ぶと、そのtickまでの入力を与える
+class ReplayPlayer:
+    def __init__(self, recorded):
+        self.recorded = recorded
+        self.position = 0
+
+    def feed(self, game):
+        inputs = self.recorded.inputs
+        while self.position < len(inputs) and inputs[self.position][0] <= game.ticks:
+            apply_input(game, inputs[self.position][1])
+            self.position += 1
+
+    # 記録の終わりまで再生したか
+    def finished(self, game):
+        if game.game_over:
+            return True
+        end_tick = self.recorded.end_tick
+        if end_tick is None:
+            return self.position >= len(self.recorded.inputs)
+        return self.position >= len(self.recorded.inputs) and game.ticks >= end_tick
+
+
+# 画面なしで最高速に再実行する
+def run(recorded, animate_line_clears=True):
+    game = recorded.new_game(animate_line_clears)
+    player = ReplayPlayer(recorded)
+    step = recorded.step
+    while True:
+        player.feed(game)
+        if player.finished(game):
+            return game
+        game.step(step)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="リプレイを画面なしで再実行する")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    total_ticks = 0
+    started = time.perf_counter()
+    for i, recorded in enumerate(load(args.path)):
+        game = run(recorded)
+        total_ticks += game.ticks
+        print(f"game {i}: seed={recorded.seed} score={game.score} lines={game.lines} "
+              f"pieces={game.pieces} ticks={game.ticks} game_over={game.game_over}")
+    elapsed = time.perf_counter() - started
+    print(f"{total_ticks} ticks in {elapsed:.3f}s ({total_ticks / max(elapsed, 1e-9):.0f} ticks/s)")
@@ -0,0 +1,119 @@
+# ハイスコアとプレイ履歴の保存(SQLite、WALモード)
+# 書き込みと集計は専用のスレッドで行うので、ゲームオーバー時にも描画ループは待たされない
+# 上位N件(全期間・今日・この筐体)は集計スレッドがメモリに持っておき、画面はtop()でそれを読むだけ
+import datetime
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+
+TOP_N = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    cabinet TEXT NOT NULL,
+    day TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    pieces INTEGER NOT NULL,
+    seed INTEGER,
+    game_over INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_score ON sessions (score DESC);
+CREATE INDEX IF NOT EXISTS sessions_day_score ON sessions (day, score DESC);
+CREATE INDEX IF NOT EXISTS sessions_cabinet_score ON sessions (cabinet, score DESC);
+"""
+
+
+# 筐体の名前(未指定なら環境変数TETRIS_CABINET、なければホスト名)
+def default_cabinet():
+    return os.environ.get("TETRIS_CABINET") or socket.gethostname()
+
+
+def today():
+    return datetime.date.today().isoformat()
+
+
+class ScoreStore:
+    def __init__(self, path="scores.db", cabinet=None, top_n=TOP_N):
+        self.path = path
+        self.cabinet = cabinet or default_cabinet()
+        self.top_n = top_n
+        self.requests = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        # 種類 -> [(得点, 消去ライン数, 日付), ...]、"daily"は集計した日付も持つ
+        self.cache = {"all": [], "daily": [], "cabinet": []}
+        self.cache_day = None
+        self.thread = threading.Thread(target=self._run, name="score-store", daemon=True)
+        self.thread.start()
+
+    # 1ゲーム分の記録(すぐに戻る)
+    def record(self, score, lines, pieces, seed=None, started_at=None, game_over=True):
+        ended_at = time.time()
+        row = (self.cabinet, today(), started_at or ended_at, ended_at, score, lines, pieces, seed, int(game_over))
+        self.requests.put(("record", row))
+
+    # 上位N件("all": 全期間、"daily": 今日、"cabinet": この筐体)
+    def top(self, kind="all"):
+        with self.lock:
+            if kind == "daily" and self.cache_day != today():
+                # 日付が変わったので集計し直す
+                self.cache_day = today()
+                self.cache["daily"] = []
+                self.requests.put(("refresh", None))
+            return self.cache[kind]
+
+    # 書き込み待ちを処理してから終了
+    def close(self, timeout=2.0):
+        self.requests.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        self._refresh(conn)
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            kind, row = request
+            if kind == "record":
+                with conn:
+                    conn.execute("INSERT INTO sessions (cabinet, day, started_at, ended_at, score, lines, pieces, "
+                                 "seed, game_over) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self._refresh(conn)
+        conn.close()
+
+    def _query(self, conn, where="", params=()):
+        return conn.execute(f"SELECT score, lines, day FROM sessions {where} ORDER BY score DESC LIMIT ?",
+                            params + (self.top_n,)).fetchall()
+
+    def _refresh(self, conn):
+        day = today()
+        cache = {
+            "all": self._query(conn),
+            "daily": self._query(conn, "WHERE day = ?", (day,)),
+            "cabinet": self._query(conn, "WHERE cabinet = ?", (self.cabinet,)),
+        }
+        with self.lock:
+            self.cache = cache
+            self.cache_day = day
+
+    # 最近のプレイ履歴(集計スレッドを介さずに読む、解析用)
+    def history(self, limit=100):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT cabinet, day, started_at, ended_at, score, lines, pieces, seed, game_over "
+                                "FROM sessions ORDER BY ended_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
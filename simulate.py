@@ -0,0 +1,202 @@
+# 画面なしでゲームを大量に実行して集計する(得点表やランダムイベントの重みの調整用)
+# ゲームごとに種を変え、プロセスプールで全コアに分けて実行する
+#   python simulate.py -n 10000 --policy greedy
+#   python simulate.py -n 10000 --line-scores 100,300,600,1000 --event-weight "SPEED UP=2" --json result.json
+# センサーは平均event_interval(ms)ごとにランダムに反応したものとして扱う
+import argparse
+import json
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import engine
+from engine import Game, PieceGenerator
+from policies import POLICIES, make_policy
+
+SIM_STEP = 10           # 1回の時間経過(ms、TETRIS.pyのLOGIC_STEPと同じ)
+ACTION_INTERVAL = 100   # 操作の間隔(ms)
+EVENT_INTERVAL = 10000  # センサーが反応する平均間隔(ms)
+MAX_PIECES = 1000       # 1ゲームの上限(上手な方針が終わらなくならないように)
+OUTCOME_PIECES = 10     # イベントの影響を見るミノの数
+
+
+# 1ゲーム実行して結果を返す
+def play_game(seed, policy="random", policy_options=None, randomizer="uniform",
+              event_interval=EVENT_INTERVAL, action_interval=ACTION_INTERVAL, max_pieces=MAX_PIECES):
+    game = Game(False, seed, randomizer)
+    rng = random.Random(seed ^ 0x5EED)  # センサーと方針用(ゲームの乱数とは別)
+    agent = make_policy(policy, rng, **(policy_options or {}))
+    event_chance = SIM_STEP / event_interval if event_interval else 0
+    lines_by_piece = [0]  # 固定したミノの数ごとの消去ライン数
+    events = []  # (イベント名, 発生時に固定済みのミノの数)
+
+    while not game.game_over and game.pieces < max_pieces:
+        action = agent.next_action(game)
+        if action:
+            game.apply_action(action)
+        for _ in range(max(1, action_interval // SIM_STEP)):
+            if game.game_over:
+                break
+            game.step(SIM_STEP)
+            if rng.random() < event_chance:
+                game.trigger_event()
+        for kind, value in game.drain_events():
+            if kind == "random_event":
+                events.append((value, game.pieces))
+        while len(lines_by_piece) <= game.pieces:
+            lines_by_piece.append(game.lines)
+
+    outcomes = []
+    for name, pieces in events:
+        after = min(pieces + OUTCOME_PIECES, len(lines_by_piece) - 1)
+        died = game.game_over and game.pieces - pieces <= OUTCOME_PIECES
+        outcomes.append((name, lines_by_piece[after] - lines_by_piece[pieces], died))
+    return {
+        "seed": seed,
+        "score": game.score,
+        "lines": game.lines,
+        "pieces": game.pieces,
+        "ticks": game.ticks,
+        "game_over": game.game_over,
+        "events": outcomes,
+    }
+
+
+def _init_worker(line_scores, lock_score, event_weights):
+    if line_scores:
+        engine.LINE_SCORES = line_scores
+    if lock_score is not None:
+        engine.LOCK_SCORE = lock_score
+    if event_weights:
+        engine.EVENT_WEIGHTS = dict(engine.EVENT_WEIGHTS, **event_weights)
+
+
+def distribution(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def at(p):
+        return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+    return {
+        "mean": statistics.fmean(values),
+        "stdev": statistics.pstdev(values),
+        "min": values[0],
+        "p10": at(10),
+        "p50": at(50),
+        "p90": at(90),
+        "max": values[-1],
+    }
+
+
+# ゲームごとの結果を集計
+def summarize(results):
+    event_stats = {}
+    for result in results:
+        for name, lines, died in result["events"]:
+            stats = event_stats.setdefault(name, {"count": 0, "lines_after": 0, "topouts_after": 0})
+            stats["count"] += 1
+            stats["lines_after"] += lines
+            stats["topouts_after"] += died
+    for stats in event_stats.values():
+        stats["mean_lines_after"] = stats.pop("lines_after") / stats["count"]
+        stats["topout_rate_after"] = stats.pop("topouts_after") / stats["count"]
+        stats["per_game"] = stats["count"] / len(results)
+    return {
+        "games": len(results),
+        "game_overs": sum(r["game_over"] for r in results),
+        "score": distribution([r["score"] for r in results]),
+        "lines": distribution([r["lines"] for r in results]),
+        "pieces": distribution([r["pieces"] for r in results]),
+        "ticks": distribution([r["ticks"] for r in results]),
+        "events": dict(sorted(event_stats.items())),
+    }
+
+
+# games回のゲームをworkersプロセスで実行(workers=1ならこのプロセスで実行)
+# line_scores/lock_score/event_weightsを指定すると各プロセスのengineの設定を書き換えて実行する
+def run(games, seed=0, workers=None, line_scores=None, lock_score=None, event_weights=None, **options):
+    seeds = [seed + i for i in range(games)]
+    play = partial(play_game, **options)
+    if workers == 1:
+        saved = engine.LINE_SCORES, engine.LOCK_SCORE, engine.EVENT_WEIGHTS
+        _init_worker(line_scores, lock_score, event_weights)
+        try:
+            results = list(map(play, seeds))
+        finally:
+            engine.LINE_SCORES, engine.LOCK_SCORE, engine.EVENT_WEIGHTS = saved
+    else:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, games // (workers * 4))
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(line_scores, lock_score, event_weights)) as pool:
+            results = list(pool.map(play, seeds, chunksize=chunksize))
+    return results
+
+
+def parse_line_scores(text):
+    return {i + 1: int(points) for i, points in enumerate(text.split(","))}
+
+
+def parse_event_weight(text):
+    name, _, weight = text.rpartition("=")
+    if name not in engine.EVENT_WEIGHTS:
+        raise argparse.ArgumentTypeError(f"unknown event: {name}")
+    return name, float(weight)
+
+
+def print_summary(summary):
+    print(f"games: {summary['games']}  game overs: {summary['game_overs']}")
+    for key in ("score", "lines", "pieces", "ticks"):
+        d = summary[key]
+        print(f"{key:<7} mean {d['mean']:10.1f}  sd {d['stdev']:9.1f}  min {d['min']:7}  "
+              f"p10 {d['p10']:7}  p50 {d['p50']:7}  p90 {d['p90']:7}  max {d['max']:7}")
+    print(f"{'event':<18}{'count':>8}{'per game':>10}{'lines after':>13}{'topout after':>14}")
+    for name, stats in summary["events"].items():
+        print(f"{name:<18}{stats['count']:8d}{stats['per_game']:10.2f}"
+              f"{stats['mean_lines_after']:13.2f}{stats['topout_rate_after']:14.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="画面なしでゲームを大量に実行して集計する")
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="最初のゲームの種(以降は1ずつ増やす)")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数(省略時はCPUコア数)")
+    parser.add_argument("--policy", choices=list(POLICIES), default="random")
+    parser.add_argument("--script", default="left,drop,right,right,drop",
+                        help="scripted方針の操作(カンマ区切り)")
+    parser.add_argument("--board", choices=["bitboard", "numpy"], default="bitboard",
+                        help="greedy方針で使う盤面(numpyは候補をまとめて評価する)")
+    parser.add_argument("--tucks", action="store_true", help="greedy方針でせり出しの下に入り込む置き方も調べる")
+    parser.add_argument("--randomizer", choices=PieceGenerator.MODES, default="uniform")
+    parser.add_argument("--event-interval", type=int, default=EVENT_INTERVAL,
+                        help="センサーが反応する平均間隔(ms、0なら反応しない)")
+    parser.add_argument("--action-interval", type=int, default=ACTION_INTERVAL, help="操作の間隔(ms)")
+    parser.add_argument("--max-pieces", type=int, default=MAX_PIECES)
+    parser.add_argument("--line-scores", type=parse_line_scores, default=None,
+                        help="1〜4行消したときの得点(カンマ区切り)")
+    parser.add_argument("--lock-score", type=int, default=None, help="ミノ固定ごとの得点")
+    parser.add_argument("--event-weight", type=parse_event_weight, action="append", default=[],
+                        help="ランダムイベントの重み(\"イベント名=重み\"、複数指定可)")
+    parser.add_argument("--json", default=None, help="集計結果の保存先")
+    args = parser.parse_args()
+
+    options = {}
+    if args.policy == "scripted":
+        options["actions"] = args.script.split(",")
+    elif args.policy == "greedy":
+        options["board"] = args.board
+        options["tucks"] = args.tucks
+    elif args.policy == "ai":
+        options["workers"] = 0  # ゲームごとにプロセスを分けているので中では並列にしない
+    results = run(args.games, args.seed, args.workers, args.line_scores, args.lock_score,
+                  dict(args.event_weight), policy=args.policy, policy_options=options,
+                  randomizer=args.randomizer, event_interval=args.event_interval,
+                  action_interval=args.action_interval, max_pieces=args.max_pieces)
+    summary = summarize(results)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,66 @@
+# フレームごとの処理時間の記録
+# 直近のフレームの時間をリングバッファに保持し、オーバーレイ表示用の統計とCSVへの書き出しを行う
+#   frame_ms: 前のフレームからの経過時間(clock.tickの戻り値)
+#   logic_ms: 入力処理と落下処理
+#   draw_ms:  描画
+#   flip_ms:  display.flip / display.update
+import csv
+import os
+import time
+from collections import deque
+
+FRAME_LOG_SIZE = 3600  # 保持するフレーム数(60FPSで1分)
+STATS_WINDOW = 120     # 統計に使う直近のフレーム数
+FIELDS = ("frame", "time", "state", "frame_ms", "logic_ms", "draw_ms", "flip_ms")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+
+class FrameLog:
+    def __init__(self, size=FRAME_LOG_SIZE):
+        self.records = deque(maxlen=size)
+        self.frame = 0
+        self.header_written = False
+
+    # 1フレーム分の記録(時間はすべて秒で渡す)
+    def add(self, state, frame_ms, logic, draw, flip):
+        self.records.append((self.frame, time.time(), state, frame_ms, logic * 1000, draw * 1000, flip * 1000))
+        self.frame += 1
+
+    # 直近windowフレームの統計
+    def stats(self, window=STATS_WINDOW):
+        recent = list(self.records)[-window:]
+        frame_times = [r[3] for r in recent]
+        return {
+            "fps": 1000 / mean(frame_times) if frame_times and mean(frame_times) else 0.0,
+            "p50": percentile(frame_times, 50),
+            "p99": percentile(frame_times, 99),
+            "logic": mean([r[4] for r in recent]),
+            "draw": mean([r[5] for r in recent]),
+            "flip": mean([r[6] for r in recent]),
+        }
+
+    # 保持している記録をCSVに追記して空にする(ゲームオーバー時と終了時に呼ぶ)
+    def dump(self, path):
+        if not self.records:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if not self.header_written and f.tell() == 0:
+                writer.writerow(FIELDS)
+            self.header_written = True
+            for frame, t, state, frame_ms, logic, draw, flip in self.records:
+                writer.writerow((frame, f"{t:.3f}", state, frame_ms, f"{logic:.3f}", f"{draw:.3f}", f"{flip:.3f}"))
+        self.records.clear()
@@ -0,0 +1,480 @@
+# 対戦モード(2台の筐体をLANでつなぐ)
+# それぞれの筐体は自分のゲームを手元で進め、相手には小さな差分だけをUDPで送る
+#   - 盤面は前回送った盤面から変わった行だけ(BOARD)
+#   - 2ライン以上消すと相手におじゃまブロックを送る(GARBAGE、"+ BLOCKS"と同じ灰色の行が下からせり上がる)
+#   - 操作中のミノ・得点・状態は毎回のパケットに載せる(新しいパケットの値だけ使う)
+# BOARDとGARBAGEには通し番号を付け、相手から受信確認(ack)が来るまで毎回のパケットに載せ直す
+# 受信側は番号順に1回ずつだけ適用するので、パケットが落ちたり重複・前後したりしても相手の盤面は一致する
+# 相手を待つことはないので、回線が遅くても自分のゲームは止まらない
+# 相手の操作中のミノは最後に届いた位置から手元で落下を予測して表示し、次のパケットで補正する
+#
+# ループバックでの確認(2つのプロセス)
+#   python TETRIS.py --versus 127.0.0.1:7001 --versus-port 7000
+#   python TETRIS.py --versus 127.0.0.1:7000 --versus-port 7001
+# 画面なしでコンピュータ同士を対戦させる(--loss/--delayで遅い回線を再現)
+#   python versus.py --port 7000 --peer 127.0.0.1:7001 --seed 1 &
+#   python versus.py --port 7001 --peer 127.0.0.1:7000 --seed 2 --loss 0.2 --delay 100
+#
+# パケット形式(ネットワークバイトオーダー)
+#   HEADER: MAGIC、バージョン、送信側のプロセスの番号(session)、ストリーム番号(epoch)、パケット番号、最後に受け取った相手のパケット番号(echo)、
+#           受信確認(相手のepochと番号順に適用し終えた最後の通し番号)、操作中のミノ(種類・回転・x・y)、得点、消去ライン数、状態
+#   続けて件数分のMESSAGE(通し番号、種類、長さ)と中身
+#     BOARD:   (行番号, 1マス4ビットの色番号を詰めた行)の並び
+#     GARBAGE: おじゃまブロックの行数(1バイト)
+# ゲームを始めるたびにepochを進めて通し番号を1からやり直し、受信側は相手の盤面を空に戻す
+# sessionは起動ごとに変わるので、相手が再起動したらパケット番号が戻っていてもすぐに受け入れ直す
+import argparse
+import random
+import socket
+import struct
+import time
+import zlib
+from collections import deque
+
+from engine import COLS, GRAY, MINOS, NORMAL_FALL_SPEED, ROWS, WHITE, Game, Tetrimino, check_collision
+
+MAGIC = b"TV"
+VERSION = 2
+DEFAULT_PORT = 7000
+SEND_INTERVAL = 16     # パケットの送信間隔(ms)
+PEER_TIMEOUT = 3000    # これだけ受信がなければ切断とみなす(ms)
+MAX_MESSAGES = 16      # 1パケットに載せる未確認メッセージの数
+MAX_OUTBOX = 256       # 未確認メッセージがこれを超えたらストリームをやり直して盤面全体を送る
+LATENCY_SAMPLES = 100  # 往復時間を保持する件数
+GARBAGE_LINES = {2: 1, 3: 2, 4: 4}  # 一度に消した行数 -> 相手に送るおじゃまブロックの行数
+
+HEADER_FORMAT = "!2sBIHIIHIbBbbIHBB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MESSAGE_FORMAT = "!IBH"
+MESSAGE_SIZE = struct.calcsize(MESSAGE_FORMAT)
+BOARD = 1
+GARBAGE = 2
+
+PLAYING = 1   # 状態のビット: ゲーム中
+TOPPED_OUT = 2  # 状態のビット: ゲームオーバーになった
+
+# 盤面の色と色番号(どの筐体でも同じ番号になるように固定)
+WIRE_COLORS = [0] + [color for _, color in MINOS] + [GRAY, WHITE]
+_wire_index = {color: index for index, color in enumerate(WIRE_COLORS)}
+ROW_BYTES = (COLS + 1) // 2
+
+
+def encode_row(row):
+    codes = [_wire_index[color] for color in row] + [0] * (ROW_BYTES * 2 - len(row))
+    return bytes(codes[i] << 4 | codes[i + 1] for i in range(0, len(codes), 2))
+
+
+def decode_row(data):
+    codes = []
+    for byte in data:
+        codes.append(byte >> 4)
+        codes.append(byte & 0xf)
+    return [WIRE_COLORS[code] for code in codes[:COLS]]
+
+
+# 盤面の差分(前回の行と変わった行だけ)、previousは行ごとのencode_rowの結果で、送った内容に更新する
+def encode_board_delta(previous, grid):
+    out = bytearray()
+    for y, row in enumerate(grid):
+        data = encode_row(row)
+        if data != previous[y]:
+            previous[y] = data
+            out.append(y)
+            out += data
+    return bytes(out)
+
+
+def apply_board_delta(grid, payload):
+    for pos in range(0, len(payload), 1 + ROW_BYTES):
+        grid[payload[pos]] = decode_row(payload[pos + 1:pos + 1 + ROW_BYTES])
+
+
+# 盤面の照合用の値(ループバックでの確認用)
+def board_digest(grid):
+    return f"{zlib.crc32(b''.join(encode_row(row) for row in grid)):08x}"
+
+
+def parse_address(text, default_port=DEFAULT_PORT):
+    host, _, port = text.rpartition(":")
+    if not host:
+        return text, default_port
+    return host, int(port)
+
+
+# UDPの送受信と通し番号の管理
+# loss/delayは送信するパケットを捨てる確率と遅らせる時間(ms)で、遅い回線の再現用
+class Link:
+    def __init__(self, peer, port=DEFAULT_PORT, host="0.0.0.0", loss=0.0, delay=0):
+        self.peer = parse_address(peer) if isinstance(peer, str) else peer
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.loss = loss
+        self.delay = delay / 1000
+        self.rng = random.Random()
+        self.delayed = deque()  # (送信する時刻, データ)
+        # 送信側
+        self.session = random.getrandbits(32)
+        self.epoch = 0
+        self.seq = 0
+        self.outbox = []      # 未確認の(通し番号, 種類, 中身)
+        self.packet = 0
+        self.sent_at = {}     # パケット番号 -> 送信時刻
+        # 受信側
+        self.peer_session = None
+        self.peer_epoch = None
+        self.received = 0     # 番号順に適用し終えた相手の通し番号
+        self.peer_packet = -1
+        self.peer_state = None
+        self.peer_updates = 0  # peer_stateを新しいパケットの値にした回数
+        self.last_seen = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # 往復時間(ms)
+
+    @property
+    def connected(self):
+        return self.last_seen is not None and time.monotonic() - self.last_seen < PEER_TIMEOUT / 1000
+
+    # 送信するストリームを最初からやり直す(未確認のメッセージは捨てる)
+    def restart(self):
+        self.epoch = (self.epoch + 1) & 0xffff
+        self.seq = 0
+        self.outbox.clear()
+
+    def queue(self, kind, payload):
+        self.seq += 1
+        self.outbox.append((self.seq, kind, payload))
+
+    # stateは(種類, 回転, x, y, 得点, 消去ライン数, 状態)
+    def send(self, state):
+        self.packet += 1
+        now = time.monotonic()
+        self.sent_at[self.packet] = now
+        self.sent_at.pop(self.packet - 128, None)
+        messages = self.outbox[:MAX_MESSAGES]
+        data = bytearray(struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.session, self.epoch, self.packet,
+                                     max(self.peer_packet, 0), self.peer_epoch or 0, self.received,
+                                     *state, len(messages)))
+        for seq, kind, payload in messages:
+            data += struct.pack(MESSAGE_FORMAT, seq, kind, len(payload))
+            data += payload
+        if self.loss and self.rng.random() < self.loss:
+            return
+        if self.delay:
+            self.delayed.append((now + self.delay, bytes(data)))
+        else:
+            self._sendto(data)
+
+    def _sendto(self, data):
+        try:
+            self.sock.sendto(data, self.peer)
+        except OSError:
+            pass  # 相手がまだ起動していない
+
+    def _flush_delayed(self):
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            self._sendto(self.delayed.popleft()[1])
+
+    # 届いたパケットを読み、新しく適用すべきメッセージ(種類, 中身)を番号順に返す
+    # 相手がストリームをやり直したら先頭に("restart", None)を入れる
+    def receive(self):
+        self._flush_delayed()
+        messages = []
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                continue  # 相手のポートが閉じている(ICMP)
+            if len(data) < HEADER_SIZE or data[:2] != MAGIC or data[2] != VERSION:
+                continue
+            (_, _, session, epoch, packet, echo, ack_epoch, ack, kind, rotation, x, y, score, lines, flags,
+             count) = struct.unpack_from(HEADER_FORMAT, data)
+            if session != self.peer_session:
+                # 相手が(再)起動した、パケット番号もストリームも最初から
+                self.peer_session = session
+                self.peer_epoch = None
+                self.peer_packet = -1
+            if epoch != self.peer_epoch:
+                if packet < self.peer_packet:
+                    continue  # やり直す前の遅れて届いたパケット
+                self.peer_epoch = epoch
+                self.received = 0
+                messages.append(("restart", None))
+            self.last_seen = time.monotonic()
+            sent = self.sent_at.pop(echo, None)
+            if sent is not None:
+                self.latencies.append((self.last_seen - sent) * 1000)
+            if ack_epoch == self.epoch:
+                self.outbox = [message for message in self.outbox if message[0] > ack]
+            if packet > self.peer_packet:
+                self.peer_packet = packet
+                self.peer_state = (kind, rotation, x, y, score, lines, flags)
+                self.peer_updates += 1
+            pos = HEADER_SIZE
+            for _ in range(count):
+                seq, message_kind, length = struct.unpack_from(MESSAGE_FORMAT, data, pos)
+                pos += MESSAGE_SIZE
+                if seq == self.received + 1:
+                    self.received = seq
+                    messages.append((message_kind, data[pos:pos + length]))
+                pos += length
+        return messages
+
+    def close(self):
+        self.sock.close()
+
+
+# 相手の盤面の写し
+# 操作中のミノはパケットが届くたびにその位置に置き、届かない間だけ通常の落下速度で落下を予測する
+class RivalBoard:
+    def __init__(self):
+        self.version = 0  # 表示内容が変わるたびに増える
+        self.state = None
+        self.reset()
+
+    def reset(self):
+        self.grid = [[0] * COLS for _ in range(ROWS)]
+        self.piece = None
+        self.fall_time = 0
+        self.version += 1
+
+    # 新しいパケットの状態
+    def apply_state(self, state):
+        kind, rotation, x, y = state[:4]
+        self.fall_time = 0
+        piece = self.piece
+        if state == self.state and (piece is None or piece.y == y):
+            return
+        self.state = state
+        self.piece = None
+        if kind >= 0:
+            self.piece = Tetrimino(kind)
+            self.piece.rotation, self.piece.x, self.piece.y = rotation, x, y
+        self.version += 1
+
+    def predict(self, dt):
+        piece = self.piece
+        if piece is None:
+            return
+        self.fall_time += dt
+        while self.fall_time > NORMAL_FALL_SPEED:
+            self.fall_time -= NORMAL_FALL_SPEED
+            if check_collision(self.grid, piece.cells, piece.x, piece.y + 1):
+                self.fall_time = 0
+                break
+            piece.y += 1
+            self.version += 1
+
+    @property
+    def score(self):
+        return self.state[4] if self.state else 0
+
+    @property
+    def lines(self):
+        return self.state[5] if self.state else 0
+
+    @property
+    def playing(self):
+        return bool(self.state and self.state[6] & PLAYING)
+
+    @property
+    def topped_out(self):
+        return bool(self.state and self.state[6] & TOPPED_OUT)
+
+
+# 自分のゲームと相手の盤面をつなぐ
+# 毎フレームupdate()を呼び、戻り値の行数だけ自分のゲームにおじゃまブロックを入れる(リプレイに残るように入力として与える)
+class Versus:
+    def __init__(self, link):
+        self.link = link
+        self.rival = RivalBoard()
+        self.game = None        # 対戦中の自分のゲーム
+        self.active = False
+        self.rival_played = False  # 自分のゲーム中に相手がゲームをしていたか
+        self.seen_updates = 0
+        self.sent_rows = None
+        self.send_time = 0
+        self.garbage_sent = 0
+        self.garbage_received = 0
+
+    # 自分のゲームを始めた
+    def start(self, game):
+        self.game = game
+        self.active = True
+        self.rival_played = self.rival.playing
+        self.link.restart()
+        self.sent_rows = [encode_row([0] * COLS) for _ in range(ROWS)]
+        self.send_time = SEND_INTERVAL
+
+    # 自分のゲームが終わった(ゲームオーバー、勝利、タイトルに戻った)
+    def stop(self):
+        if self.active:
+            self.queue_board()  # 最後の盤面は届くまで送り直す
+            self.active = False
+            self.send_time = SEND_INTERVAL
+
+    # 消した行数に応じておじゃまブロックを送る
+    def lines_cleared(self, count):
+        lines = GARBAGE_LINES.get(count, 0)
+        if lines and self.active:
+            self.link.queue(GARBAGE, bytes([lines]))
+            self.garbage_sent += lines
+
+    # 受信と送信、自分のゲームに入れるおじゃまブロックの行数を返す
+    def update(self, dt):
+        garbage = 0
+        for kind, payload in self.link.receive():
+            if kind == "restart":
+                self.rival.reset()
+            elif kind == BOARD:
+                apply_board_delta(self.rival.grid, payload)
+                self.rival.version += 1
+            elif kind == GARBAGE and self.active:
+                garbage += payload[0]
+        if self.link.peer_updates != self.seen_updates:
+            self.seen_updates = self.link.peer_updates
+            self.rival.apply_state(self.link.peer_state)
+        if self.active and self.rival.playing:
+            self.rival_played = True
+        self.rival.predict(dt)
+        self.garbage_received += garbage
+
+        self.send_time += dt
+        if self.send_time >= SEND_INTERVAL:
+            self.send_time = 0
+            self.send()
+        return garbage
+
+    def send(self):
+        game = self.game
+        if game is None:
+            self.link.send((-1, 0, 0, 0, 0, 0, 0))
+            return
+        if self.active:
+            self.queue_board()
+        piece = game.active_piece if self.active else None
+        flags = (PLAYING if self.active else 0) | (TOPPED_OUT if game.game_over else 0)
+        if piece is None:
+            state = (-1, 0, 0, 0)
+        else:
+            state = (piece.kind, piece.rotation, piece.x, piece.y)
+        self.link.send(state + (game.score, min(game.lines, 0xffff), flags))
+
+    # 前回送った盤面から変わった行を送る
+    def queue_board(self):
+        grid = self.game.grid
+        delta = encode_board_delta(self.sent_rows, grid)
+        if delta:
+            self.link.queue(BOARD, delta)
+        if len(self.link.outbox) > MAX_OUTBOX:
+            # 相手と長く通じていないので盤面全体を送り直す
+            self.link.restart()
+            self.sent_rows = [b""] * ROWS
+            self.link.queue(BOARD, encode_board_delta(self.sent_rows, grid))
+
+    # 相手が先にゲームオーバーになった
+    def won(self):
+        return self.active and self.rival_played and self.rival.topped_out
+
+    def result(self):
+        if self.game is None or not self.rival_played:
+            return None
+        if self.game.game_over:
+            return "YOU LOSE"
+        if self.rival.topped_out:
+            return "YOU WIN"
+        return None
+
+    # 表示用の状態
+    def status(self):
+        if not self.link.connected:
+            return "NO LINK"
+        if self.rival.topped_out:
+            return "TOP OUT"
+        if self.rival.playing:
+            return "PLAYING"
+        return "WAITING"
+
+    # 往復時間の中央値(ms、まだ測れていなければNone)
+    def ping(self):
+        latencies = sorted(self.link.latencies)
+        return round(latencies[len(latencies) // 2]) if latencies else None
+
+    def close(self):
+        self.link.close()
+
+
+# 画面なしでコンピュータ同士を実時間で対戦させ、結果と盤面の照合用の値を表示する
+def run(args):
+    from policies import make_policy
+
+    link = Link(args.peer, args.port, loss=args.loss, delay=args.delay)
+    versus = Versus(link)
+    rng = random.Random(args.seed)
+    agent = make_policy(args.policy, rng)
+    game = Game(True, args.seed)
+    step = 10
+
+    # 相手とつながるまで待つ
+    waited = 0
+    while not link.connected and waited < args.connect_timeout * 1000:
+        versus.update(step)
+        time.sleep(step / 1000)
+        waited += step
+    if not link.connected:
+        print("no peer")
+        link.close()
+        return
+
+    versus.start(game)
+    last = time.monotonic()
+    action_time = 0
+    deadline = last + args.seconds
+    while True:
+        time.sleep(step / 1000)
+        now = time.monotonic()
+        dt = round((now - last) * 1000)
+        last = now
+        for _ in range(versus.update(dt)):
+            game.receive_garbage()
+        action_time += dt
+        if action_time >= args.action_interval:
+            action_time = 0
+            action = agent.next_action(game)
+            if action:
+                game.apply_action(action)
+        for _ in range(max(1, dt // step)):
+            game.step(step)
+        for kind, value in game.drain_events():
+            if kind == "lines":
+                versus.lines_cleared(len(value[0]))
+        if game.game_over or versus.won() or now >= deadline:
+            break
+
+    # 最後の盤面を相手に届け、相手の最後の盤面を受け取るまでしばらく送受信を続ける
+    versus.stop()
+    linger = time.monotonic() + args.linger
+    while time.monotonic() < linger:
+        versus.update(step)
+        time.sleep(step / 1000)
+    print(f"result {versus.result() or 'DRAW'} score {game.score} lines {game.lines} "
+          f"garbage sent {versus.garbage_sent} received {versus.garbage_received} ping {versus.ping()}ms")
+    print(f"own {board_digest(game.grid)} rival {board_digest(versus.rival.grid)}")
+    versus.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="自分が受信するポート")
+    parser.add_argument("--peer", required=True, help="相手の筐体(ホスト:ポート)")
+    parser.add_argument("--seed", type=int, default=None, help="ゲームとコンピュータの乱数の種")
+    parser.add_argument("--policy", default="greedy", help="コンピュータの方針(policies.POLICIES)")
+    parser.add_argument("--action-interval", type=int, default=100, help="操作の間隔(ms)")
+    parser.add_argument("--seconds", type=float, default=60, help="対戦する最大の時間(秒)")
+    parser.add_argument("--linger", type=float, default=1.5, help="終了後に送受信を続ける時間(秒)")
+    parser.add_argument("--connect-timeout", type=float, default=30, help="相手を待つ時間(秒)")
+    parser.add_argument("--loss", type=float, default=0.0, help="送信パケットを捨てる確率(遅い回線の再現)")
+    parser.add_argument("--delay", type=int, default=0, help="送信パケットを遅らせる時間(ms)")
+    run(parser.parse_args())